@@ -1,20 +1,26 @@
 import json
 import os
-import pickle
 import tkinter as tk
 import tkinter.ttk as ttk
 from collections import namedtuple
 from tkinter.font import Font
-from typing import Tuple, List
+from typing import List, Optional, Tuple, Union
 
-import easygui
-import jpype
-from jpype._jvmfinder import JVMNotFoundException
+import backends
+import constants
+import generator
+import instrument
+import solver
+from validation import ConflictTracker
 
-from operateImage import *
+# numpy, PIL, jpype and easygui are imported where they are first needed, so that
+# the window comes up without loading them
 
 
 def start_jvm(path: str = None):
+    import jpype
+    from jpype._jvmfinder import JVMNotFoundException
+
     if path:
         print("Java path: " + path)
         jpype.startJVM(path, r"-Djava.class.path=sudoku.jar")
@@ -40,6 +46,8 @@ def start_jvm(path: str = None):
                 "Program will search under the directory you provide.",
                 False
             ).run()
+            import easygui
+
             root = easygui.diropenbox(
                 "Choose the directory where java is installed", "Locate JVM"
             )
@@ -61,68 +69,82 @@ def start_jvm(path: str = None):
     return j_path
 
 
-def main():
-    user_config = {}
+def load_user_config() -> dict:
     if "userConfig.json" in os.listdir(os.getcwd()):
         with open("userConfig.json") as f:
-            user_config: dict = json.load(f)
+            return json.load(f)
+    return {}
 
-    # Look for JVM...
-    if ("jvmPath" in user_config.keys()) and (user_config["jvmPath"]):
+
+def start_configured_jvm():
+    """
+    Start the JVM of the Java backend, from the path saved in userConfig.json or
+    by looking for it (and saving it) the first time
+    """
+    user_config = load_user_config()
+    if user_config.get("jvmPath"):
         start_jvm(user_config["jvmPath"])
-    else:
-        user_config["jvmPath"] = start_jvm()
+        return
+    user_config["jvmPath"] = start_jvm()
     with open("userConfig.json", "w") as f:
         json.dump(user_config, f)
 
+
+def main():
+    user_config = load_user_config()
+    # The JVM is only started if the Java backend is chosen ("solverBackend" in
+    # userConfig.json or constants.SOLVER_BACKEND), and only when first used
+    backends.register("java", lambda: backends.JavaBackend(start_configured_jvm))
+
     # Start APP...
-    app = App()
+    app = App(backends.get(user_config.get("solverBackend")))
     # app.load_board(load_from_image("test/sudoku1.jpg").board)
     app.run()
 
 
+_recognition_cache = None
+
+
 def load_from_image(img_name: str):
-    board = []
-    with open("train.module", "rb") as f:
-        train_data = pickle.load(f)
-    img = optimize_board(Image.open(img_name))
-    line = 0
-    temp = []
-    fail = []
-    count = 1
-    for grid in split_board(img):
-        count += 1
-        try:
-            feature = get_image_feature(grid)
-        except AssertionError:
-            print("fail at ", count)
-            temp.append(0)
-            fail.append((count % 9, count // 9))
-            continue
-        if feature:
-            temp.append(ocr(train_data, np.array(feature)))
-        else:
-            temp.append(0)
-        if line == 8:
-            line = 0
-            board.append(temp[:])
-            temp = []
-        else:
-            line += 1
-    out = namedtuple("GeneratedBoard", ["board", "fail"])
-    out.board = board
-    out.fail = fail
+    global _recognition_cache
+    from PIL import Image
+
+    import disambiguate
+    from cache import RecognitionCache
+
+    if _recognition_cache is None:
+        _recognition_cache = RecognitionCache(directory=constants.RECOGNITION_CACHE_DIR)
+    img = Image.open(img_name)
+    with instrument.stage("decode"):
+        img.load()
+    result = _recognition_cache.recognize(img)
+    for row, column in result.fail:
+        print("fail at ", (row, column))
+    # Doubtful digits that leave the board without a unique solution are
+    # replaced by runner-up readings that give one
+    resolved = disambiguate.resolve(result)
+    for row, column, read, used in resolved.changed:
+        print("corrected at ", (row, column), read, "->", used)
+    out = namedtuple("GeneratedBoard", ["board", "fail", "changed", "solutions"])
+    out.board = resolved.board
+    out.fail = result.fail
+    out.changed = resolved.changed
+    out.solutions = resolved.solutions
     return out
 
 
 class App(tk.Tk):
-    def __init__(self):
+    def __init__(self, backend: Optional[backends.SolverBackend] = None):
         super(App, self).__init__()
         self.title("Sudoku")
         self.resizable(False, False)
 
-        # Java chessboard object
-        self.board = jpype.JClass("javaGame.Board")()
+        # Solver backend and its chessboard object
+        self.backend = backend or backends.get()
+        self.board = self.backend.new_board()
+
+        # Puzzle corpus used by random_generate, opened on first use
+        self.corpus = None
 
         # Store the puzzle generated, don't let user change it during the game
         self.original_state = [[0 for x in range(9)] for y in range(9)]
@@ -142,6 +164,9 @@ class App(tk.Tk):
         # Store all warning blocks
         self.warning_block_list = []
 
+        # Digit counters of the board, tells which blocks conflict as the user types
+        self.conflicts = ConflictTracker()
+
         # Draw board and pack canvas
         self.canvas = tk.Canvas(self, width=270, height=270)
         self.canvas.config(borderwidth=2)
@@ -202,52 +227,73 @@ class App(tk.Tk):
         self.bind("<Down>", self.move_select)
 
     def solve(self):
-        self.board.setBoard(self.original_state)
-        if not self.board.solvePuzzle():
+        solution = self.backend.solve(self.original_state)
+        if not solution:
             AlertWindow("Error", "Cannot solve this board!", False).run()
             return
         for i in range(9):
             for j in range(9):
                 if not self.original_state[i][j]:
-                    self.set_number((i, j), self.board.board[i][j], record=False)
+                    self.set_number((i, j), solution[i][j], record=False)
 
     def reset(self):
         self.board.setBoard([[0 for x in range(9)] for y in range(9)])
         self.show_board()
 
     def check(self):
-        for _ in range(len(self.warning_block_list)):
-            self.canvas.delete(self.warning_block_list.pop()[0])
-
-        error_list = []
-        for i in range(9):
-            for j in range(9):
-                if not self.original_state[i][j]:
-                    if not self.board.checkValidity(i, j):
-                        error_list.append((i, j))
-        for block in error_list:
-            self.warning_block_list.append(
-                (
-                    self.canvas.create_rectangle(
-                        (
-                            block[0] * 30,
-                            block[1] * 30,
-                            (block[0] + 1) * 30,
-                            (block[1] + 1) * 30,
-                        ),
-                        outline="Purple",
-                        width=2,
-                    ),
-                    block,
-                )
-            )
+        error_list = [
+            block
+            for block in self.conflicts.conflicts
+            if not self.original_state[block[0]][block[1]]
+        ]
+        self.update_warnings(error_list)
         if not error_list:
             AlertWindow("Congratulation", "No problems found so far!", False).run()
 
-    def random_generate(self):
-        self.board.setBoard([[0 for x in range(9)] for y in range(9)])
-        self.board.randomGenerateBoard()
-        self.board.generatePuzzle(30, 60)
+    def update_warnings(self, blocks) -> None:
+        """
+        Show or hide the warning frame of blocks according to the conflict tracker
+        :param blocks: coordinates of blocks whose conflict state may have changed
+        :return: None
+        """
+        for block in blocks:
+            warned = [i for i in self.warning_block_list if i[1] == block]
+            conflict = (
+                    block in self.conflicts.conflicts
+                    and not self.original_state[block[0]][block[1]]
+            )
+            if conflict and not warned:
+                self.warning_block_list.append(
+                    (
+                        self.canvas.create_rectangle(
+                            (
+                                block[0] * 30,
+                                block[1] * 30,
+                                (block[0] + 1) * 30,
+                                (block[1] + 1) * 30,
+                            ),
+                            outline="Purple",
+                            width=2,
+                        ),
+                        block,
+                    )
+                )
+            elif not conflict and warned:
+                self.canvas.delete(warned[0][0])
+                self.warning_block_list.remove(warned[0])
+
+    def random_generate(self, difficulty: str = "medium"):
+        # Draw from the pre-generated corpus when there is one, generate otherwise
+        record = None
+        if os.path.isfile(constants.CORPUS_PATH):
+            if self.corpus is None:
+                import corpus
+
+                self.corpus = corpus.Corpus(constants.CORPUS_PATH)
+            record = self.corpus.random(difficulty)
+        if record is None:
+            record = generator.generate(difficulty)
+        self.board.setBoard(solver.to_board(record.puzzle))
         self.show_board()
 
     def load_from_disk(self):
@@ -274,10 +320,14 @@ class App(tk.Tk):
             for j in i:
                 self.canvas.delete(j)
         self.canvas_num = [[None for x in range(9)] for y in range(9)]
+        for _ in range(len(self.warning_block_list)):
+            self.canvas.delete(self.warning_block_list.pop()[0])
+        self.conflicts.reset()
 
         for x in range(9):
             for y in range(9):
                 if self.board.board[x][y] != 0:
+                    self.original_state[x][y] = self.board.board[x][y]
                     self.set_number(
                         (x, y),
                         self.board.board[x][y],
@@ -285,7 +335,6 @@ class App(tk.Tk):
                         color="black",
                         record=False,
                     )
-                    self.original_state[x][y] = self.board.board[x][y]
 
     def withdraw(self, e: tk.Event = None) -> None:
         """
@@ -398,12 +447,7 @@ class App(tk.Tk):
             fill=color,
         )
 
-        # Check if this is a warned block
-        for i in self.warning_block_list:
-            if i[1] == block:
-                self.canvas.delete(i[0])
-                self.warning_block_list.remove(i)
-                break
+        self.update_warnings(self.conflicts.set(block, number))
 
         if record:
             if not self.operation_list:
@@ -427,6 +471,7 @@ class App(tk.Tk):
         if position:
             num = self.board.board[position[0]][position[1]]
             self.board.board[position[0]][position[1]] = 0
+            self.update_warnings(self.conflicts.clear(position))
             if self.canvas_num[position[0]][position[1]]:
                 self.canvas.delete(self.canvas_num[position[0]][position[1]])
                 if record:
@@ -442,6 +487,7 @@ class App(tk.Tk):
             if self.original_state[self.selected[0]][self.selected[1]] == 0:
                 num = self.board.board[self.selected[0]][self.selected[1]]
                 self.board.board[self.selected[0]][self.selected[1]] = 0
+                self.update_warnings(self.conflicts.clear(self.selected))
                 if self.canvas_num[self.selected[0]][self.selected[1]]:
                     self.canvas.delete(
                         self.canvas_num[self.selected[0]][self.selected[1]]
@@ -0,0 +1,127 @@
+"""
+Solver backends of the app. A backend makes the board object the window edits
+(board[row][column] and setBoard, the interface of javaGame.Board) and solves
+puzzles. "python" runs in process and is the default; "java" drives
+javaGame.Board through jpype and starts the JVM only when it is first used.
+
+    backend = backends.get()
+    board = backend.new_board()
+    solution = backend.solve(puzzle)
+"""
+import abc
+from typing import Callable, Dict, Optional
+
+import constants
+import memo
+import solver
+
+
+class PythonBoard:
+    """
+    In-process stand-in for javaGame.Board
+    """
+
+    def __init__(self, data: solver.Board = None):
+        self.board = data or [[0 for x in range(9)] for y in range(9)]
+
+    def setBoard(self, board: solver.Board) -> None:
+        if len(board) != 9 or any(len(row) != 9 for row in board):
+            raise IndexError("Board must be 9 * 9")
+        self.board = [[int(num) for num in row] for row in board]
+
+    def solvePuzzle(self) -> bool:
+        solution = solver.solve(self.board)
+        if solution is None:
+            return False
+        self.board = solution
+        return True
+
+
+class SolverBackend(abc.ABC):
+    name = ""
+
+    @abc.abstractmethod
+    def new_board(self):
+        """
+        :return: empty board object with a board[row][column] grid and setBoard
+        """
+
+    @abc.abstractmethod
+    def solve(self, puzzle: solver.Board) -> Optional[solver.Board]:
+        """
+        :return: solved 9 * 9 2d array, None if the puzzle has no solution
+        """
+
+
+class PythonBackend(SolverBackend):
+    name = "python"
+
+    def __init__(self):
+        self._cache = None
+
+    def new_board(self) -> PythonBoard:
+        return PythonBoard()
+
+    def solve(self, puzzle: solver.Board) -> Optional[solver.Board]:
+        if self._cache is None:
+            self._cache = memo.SolveCache()
+        solution = self._cache.solve(puzzle)
+        return solver.to_board(solution) if solution else None
+
+
+class JavaBackend(SolverBackend):
+    name = "java"
+
+    def __init__(self, start_jvm: Callable[[], None] = None):
+        """
+        :param start_jvm: starts the JVM with sudoku.jar on its class path, called
+                          before the first board is made; jpype's default JVM if None
+        """
+        self.start_jvm = start_jvm
+
+    def _board_class(self):
+        import jpype
+
+        if not jpype.isJVMStarted():
+            if self.start_jvm:
+                self.start_jvm()
+            else:
+                jpype.startJVM(r"-Djava.class.path=sudoku.jar")
+        return jpype.JClass("javaGame.Board")
+
+    def new_board(self):
+        return self._board_class()()
+
+    def solve(self, puzzle: solver.Board) -> Optional[solver.Board]:
+        board = self.new_board()
+        board.setBoard(puzzle)
+        if not board.solvePuzzle():
+            return None
+        return [[int(num) for num in row] for row in board.board]
+
+
+_factories: Dict[str, Callable[[], SolverBackend]] = {
+    "python": PythonBackend,
+    "java": JavaBackend,
+}
+_instances: Dict[str, SolverBackend] = {}
+
+
+def register(name: str, factory: Callable[[], SolverBackend]) -> None:
+    """
+    Add or replace a backend, factory is called once on first use
+    """
+    _factories[name] = factory
+    _instances.pop(name, None)
+
+
+def get(name: str = None) -> SolverBackend:
+    """
+    :param name: registered backend, defaults to constants.SOLVER_BACKEND
+    """
+    name = name or constants.SOLVER_BACKEND
+    if name not in _instances:
+        if name not in _factories:
+            raise ValueError("Unknown solver backend: " + str(name))
+        _instances[name] = _factories[name]()
+    return _instances[name]
@@ -0,0 +1,165 @@
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from numpy import ndarray
+
+import solver
+
+ALL = np.uint16(solver.ALL)
+# UNIT_CELLS[u]: the 9 cells of unit u; CELL_UNITS[i]: row, column and box unit of cell i
+UNIT_CELLS = np.array(solver.UNITS, dtype=np.intp)
+CELL_UNITS = np.array(
+    [[solver.ROW[i], 9 + solver.COL[i], 18 + solver.BOX[i]] for i in range(81)], dtype=np.intp
+)
+POPCOUNT = np.array(solver.POPCOUNT, dtype=np.uint8)
+# DIGIT_OF[mask]: digit of a single-bit mask, 0 otherwise
+DIGIT_OF = np.zeros(solver.ALL + 1, dtype=np.uint8)
+for _bit, _digit in solver.DIGIT.items():
+    DIGIT_OF[_bit] = _digit
+
+# Board states after propagation
+UNSOLVED, SOLVED, INVALID = 0, 1, 2
+
+
+def to_candidates(puzzles: Sequence[solver.Puzzle]) -> ndarray:
+    """
+    :return: (N, 81) uint16 candidate masks, a single bit for every given
+    """
+    digits = np.array([solver.parse_puzzle(p) for p in puzzles], dtype=np.uint16).reshape(-1, 81)
+    return np.where(digits > 0, np.left_shift(1, digits - 1, dtype=np.uint16), ALL).astype(
+        np.uint16
+    )
+
+
+def _unit_or(values: ndarray) -> ndarray:
+    """
+    (N, 81) -> (N, 27) bitwise OR over the cells of every unit
+    """
+    return np.bitwise_or.reduce(values[:, UNIT_CELLS], axis=2)
+
+
+def _cell_or(per_unit: ndarray) -> ndarray:
+    """
+    (N, 27) -> (N, 81) bitwise OR over the three units of every cell
+    """
+    gathered = per_unit[:, CELL_UNITS]
+    return gathered[:, :, 0] | gathered[:, :, 1] | gathered[:, :, 2]
+
+
+def _round(cand: ndarray) -> Tuple[ndarray, ndarray]:
+    """
+    One propagation round over every board: naked singles eliminate their digit
+    from the peers, then hidden singles are fixed
+    :return: new candidates and a bool array marking contradictory boards
+    """
+    single = POPCOUNT[cand] == 1
+    placed = np.where(single, cand, 0).astype(np.uint16)
+    by_unit = placed[:, UNIT_CELLS]
+    unit_placed = np.bitwise_or.reduce(by_unit, axis=2)
+    # Distinct bits add up to their OR, a repeated digit makes the sum differ
+    clash = (by_unit.sum(axis=2, dtype=np.int32) != unit_placed).any(axis=1)
+
+    cand = np.where(single, cand, cand & ~_cell_or(unit_placed)).astype(np.uint16)
+
+    # Digits present in exactly one cell of a unit
+    by_unit = cand[:, UNIT_CELLS]
+    once = np.zeros(by_unit.shape[:2], dtype=np.uint16)
+    twice = np.zeros_like(once)
+    for k in range(9):
+        twice |= once & by_unit[:, :, k]
+        once |= by_unit[:, :, k]
+    missing = (once != ALL).any(axis=1)
+    hidden = (once & ~twice).astype(np.uint16)
+    forced = cand & _cell_or(hidden)
+    cand = np.where((forced != 0) & ~single, forced, cand).astype(np.uint16)
+
+    invalid = clash | missing | (cand == 0).any(axis=1) | (POPCOUNT[forced] > 1).any(axis=1)
+    return cand, invalid
+
+
+def propagate(cand: ndarray, max_rounds: int = 81) -> Tuple[ndarray, ndarray]:
+    """
+    Run propagation rounds on all boards at once until none of them changes
+    :param cand: (N, 81) uint16 candidate masks, see to_candidates
+    :return: final candidates and the state of every board (UNSOLVED, SOLVED or INVALID)
+    """
+    cand = cand.copy()
+    state = np.full(len(cand), UNSOLVED, dtype=np.uint8)
+    active = np.arange(len(cand))
+    for _ in range(max_rounds):
+        if not len(active):
+            break
+        before = cand[active]
+        after, invalid = _round(before)
+        cand[active] = after
+        state[active[invalid]] = INVALID
+        done = (POPCOUNT[after] == 1).all(axis=1) & ~invalid
+        state[active[done]] = SOLVED
+        changed = (after != before).any(axis=1)
+        active = active[changed & ~invalid & ~done]
+    return cand, state
+
+
+def _split(cand: ndarray) -> ndarray:
+    """
+    Branch every board on its unfilled cell with the fewest candidates: the first
+    child keeps the lowest candidate only, the second child the others
+    :return: (2N, 81) children, those of board k at rows 2k and 2k + 1
+    """
+    counts = POPCOUNT[cand]
+    cell = np.where(counts > 1, counts, 10).argmin(axis=1)
+    rows = np.arange(len(cand))
+    chosen = cand[rows, cell]
+    low = chosen & (~chosen + np.uint16(1))
+    children = np.repeat(cand, 2, axis=0)
+    children[2 * rows, cell] = low
+    children[2 * rows + 1, cell] = chosen & ~low
+    return children
+
+
+def solve_batch(
+        puzzles: Sequence[solver.Puzzle],
+        chunk_size: int = 4096,
+        max_frontier: int = 65536,
+        max_branches: int = 32,
+) -> List[Optional[List[int]]]:
+    """
+    Solve many puzzles at once. Propagation runs vectorized over the whole
+    chunk; boards it cannot finish are branched together, breadth first, and
+    propagated again. A board whose open branches grow past max_branches (sparse
+    or ambiguous puzzles, where breadth first search explodes) falls back to the
+    per-board search of solver, as do all remaining boards once the open branches
+    of the chunk grow past max_frontier.
+    :return: flat solution of every puzzle, None where there is none
+    """
+    out = []
+    for begin in range(0, len(puzzles), chunk_size):
+        chunk = puzzles[begin:begin + chunk_size]
+        cand, state = propagate(to_candidates(chunk))
+        solutions: List[Optional[List[int]]] = [None] * len(chunk)
+        for k in np.flatnonzero(state == SOLVED):
+            solutions[k] = DIGIT_OF[cand[k]].tolist()
+
+        # Open branches and the board each of them belongs to
+        owner = np.flatnonzero(state == UNSOLVED)
+        frontier = cand[owner]
+        fallback = set()
+        while len(owner) and len(owner) <= max_frontier:
+            frontier, branch_state = propagate(_split(frontier))
+            owner = np.repeat(owner, 2)
+            for k in np.flatnonzero(branch_state == SOLVED):
+                if solutions[owner[k]] is None:
+                    solutions[owner[k]] = DIGIT_OF[frontier[k]].tolist()
+            keep = branch_state == UNSOLVED
+            keep &= np.array([solutions[o] is None for o in owner], dtype=bool)
+            branches = np.bincount(owner[keep], minlength=len(chunk))
+            crowded = branches[owner] > max_branches
+            fallback.update(owner[keep & crowded].tolist())
+            keep &= ~crowded
+            owner, frontier = owner[keep], frontier[keep]
+
+        fallback.update(owner.tolist())
+        for k in sorted(fallback):
+            solutions[k] = solver.solve_flat(chunk[k])
+        out.extend(solutions)
+    return out
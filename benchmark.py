@@ -0,0 +1,309 @@
+"""
+Per-stage timings of the recognition and solving hot paths.
+
+    python benchmark.py                          # print a report
+    python benchmark.py --save baseline.json     # keep the numbers
+    python benchmark.py --compare baseline.json  # exit 1 if a stage got slower
+
+Whatever the options, it also exits 1 if batchSolver.solve_batch is much slower
+than solving one board at a time on empty and nearly empty boards.
+
+Recognition stages run over the pictures in test/ and over synthetic cells,
+solving stages over the rated puzzles in benchmark_puzzles.txt. Every stage gets
+a warm-up pass and then several timed ones, and is compared with the baseline
+relative to a fixed piece of reference work timed alongside it; stages that
+look slower are measured again before they are reported.
+"""
+import argparse
+import glob
+import json
+import random
+import sys
+import time
+from typing import Callable, Iterable, List
+
+from PIL import Image, ImageDraw
+
+import batchSolver
+import dlx
+import generator
+import solver
+from classifier import load_classifier
+from operateImage import *
+
+PUZZLE_FILE = "benchmark_puzzles.txt"
+
+
+def reference_work(loops: int = 20000) -> float:
+    """
+    Time a fixed piece of pure Python work, the yardstick stage timings are
+    compared in so that a machine that is slower as a whole does not count as
+    a regression
+    :return: duration in seconds
+    """
+    start = time.perf_counter()
+    total = 0
+    for i in range(loops):
+        total += i * i
+    return time.perf_counter() - start
+
+
+def measure(
+        fn: Callable, items: Iterable, repeat: int = 5, min_seconds: float = 0.2
+) -> List[tuple]:
+    """
+    One untimed warm-up pass over the items, then timed passes, at least repeat
+    of them and as many more as fit in min_seconds, each one right after a run
+    of reference_work
+    :return: (reference_work duration, [duration in seconds of every call fn(item)])
+             of every pass
+    """
+    items = list(items)
+    for item in items:
+        fn(item)
+    passes = []
+    deadline = time.perf_counter() + min_seconds
+    while len(passes) < repeat or time.perf_counter() < deadline:
+        reference = reference_work()
+        durations = []
+        for item in items:
+            start = time.perf_counter()
+            fn(item)
+            durations.append(time.perf_counter() - start)
+        passes.append((reference, durations))
+    return passes
+
+
+def summarize(stage: str, passes: List[tuple]) -> dict:
+    """
+    p50 is that of the fastest pass, the least disturbed by the rest of the
+    machine, and p50_ref its ratio to the fastest reference_work run of the same
+    passes; the other numbers are over all passes
+    """
+    def percentile(ordered, p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    p50 = min(percentile(sorted(durations), 50) for _, durations in passes)
+    ordered = sorted(d for _, durations in passes for d in durations)
+    total = sum(ordered)
+    return {
+        "stage": stage,
+        "count": len(ordered),
+        "per_second": len(ordered) / total if total else float("inf"),
+        "p50_ms": p50 * 1000,
+        "p50_ref": p50 / min(reference for reference, _ in passes),
+        "p99_ms": percentile(ordered, 99) * 1000,
+    }
+
+
+def synthetic_cells(count: int, size: int = 56, seed: int = 0) -> List[Image.Image]:
+    """
+    Grayscale cells holding a randomly placed digit, some left empty
+    """
+    rng = random.Random(seed)
+    cells = []
+    for _ in range(count):
+        small = Image.new("L", (14, 14), 255)
+        if rng.random() < 0.7:
+            ImageDraw.Draw(small).text(
+                (rng.randint(2, 5), rng.randint(0, 3)), str(rng.randint(1, 9)), fill=0
+            )
+        cells.append(small.resize((size, size), Image.NEAREST))
+    return cells
+
+
+def load_puzzles(path: str = PUZZLE_FILE) -> List[tuple]:
+    """
+    :return: (puzzle string, difficulty) of every line
+    """
+    with open(path) as f:
+        return [tuple(line.split()) for line in f if line.strip()]
+
+
+def stages(pictures: List[str]) -> List[tuple]:
+    """
+    :return: (name, fn, items) of every stage, fn being timed on each of the items
+    """
+    images = [Image.open(path).convert("RGB") for path in pictures]
+    boards = [optimize_board(img) for img in images]
+    cells = [cell for board in boards for cell in split_board(board)]
+    cells += synthetic_cells(81)
+    classifier = load_classifier()
+    features = [f for f in (get_image_feature(cell) for cell in cells) if f]
+
+    out = [
+        ("binarize", binarize, images),
+        ("optimize_board", optimize_board, images),
+        ("warp_board", warp_board, images),
+        ("split_board", lambda b: list(split_board(b)), boards),
+        ("split_board_views", lambda b: split_board(b, as_array=True), boards),
+        ("get_image_feature", get_image_feature, cells),
+        ("ocr", lambda f: ocr(classifier, f), features),
+        ("ocr_batch_81", lambda b: classifier.predict(b), [features[:81]] * 10),
+        ("recognize_board", lambda img: recognize_board(img, classifier), images),
+    ]
+    puzzles = load_puzzles()
+    for difficulty in generator.DIFFICULTIES:
+        batch = [p for p, d in puzzles if d == difficulty]
+        out.append((f"solve_{difficulty}", solver.solve_flat, batch))
+        out.append((f"unique_{difficulty}", dlx.count_solutions, batch))
+    # Seeded per call, so that every pass generates the same puzzles
+    out.append((
+        "generate_medium",
+        lambda seed: generator.generate("medium", rng=random.Random(seed)),
+        range(10),
+    ))
+    return out
+
+
+def run(stage_list: List[tuple], repeat: int = 5) -> List[dict]:
+    """
+    :param stage_list: see stages
+    """
+    return [summarize(name, measure(fn, items, repeat)) for name, fn, items in stage_list]
+
+
+def sparse_puzzles(seed: int = 0) -> List[List]:
+    """
+    Batches of empty and nearly empty boards, where breadth first branching explodes
+    """
+    rng = random.Random(seed)
+    few = []
+    for _ in range(20):
+        solution = generator.random_solution(rng)
+        givens = set(rng.sample(range(81), 20))
+        few.append([num if i in givens else 0 for i, num in enumerate(solution)])
+    return [["." * 81], ["1" + "." * 80], few]
+
+
+def check_batch(factor: float = 5.0, repeat: int = 3) -> List[str]:
+    """
+    :return: a message for every batch of sparse_puzzles that solve_batch takes
+             more than factor times as long on as solver.solve_flat in a loop,
+             best of repeat runs each
+    """
+    messages = []
+    for batch in sparse_puzzles():
+        batched = min(sum(d) for _, d in measure(batchSolver.solve_batch, [batch], repeat))
+        looped = min(
+            sum(d) for _, d in measure(lambda b: [solver.solve_flat(p) for p in b], [batch], repeat)
+        )
+        if batched > looped * factor:
+            messages.append(
+                f"solve_batch on {len(batch)} sparse boards: {batched * 1000:.1f}ms,"
+                f" {looped * 1000:.1f}ms one by one"
+            )
+    return messages
+
+
+def _slower(row: dict, old: dict, tolerance: float, min_delta: float) -> bool:
+    if "p50_ref" not in old:
+        return False
+    growth = row["p50_ref"] / old["p50_ref"]
+    return growth > 1 + tolerance and old["p50_ms"] * (growth - 1) > min_delta
+
+
+def compare(
+        results: List[dict], baseline: List[dict], tolerance: float, min_delta: float = 0.05
+) -> List[str]:
+    """
+    Stages are compared by p50_ref, their p50 relative to reference_work
+    :param min_delta: growth of p50 in milliseconds below which a stage never
+                      counts as slower
+    :return: a message for every stage whose p50 grew by more than tolerance and min_delta
+    """
+    if any("p50_ref" not in row for row in baseline):
+        return ["baseline saved by an older benchmark.py, save it again"]
+    before = {row["stage"]: row for row in baseline}
+    regressions = []
+    for row in results:
+        old = before.get(row["stage"])
+        if old and _slower(row, old, tolerance, min_delta):
+            growth = row["p50_ref"] / old["p50_ref"] - 1
+            regressions.append(
+                f"{row['stage']}: p50 {old['p50_ms']:.3f}ms -> {row['p50_ms']:.3f}ms"
+                f" ({growth:+.0%} relative to the reference work)"
+            )
+    return regressions
+
+
+def recheck(
+        stage_list: List[tuple],
+        results: List[dict],
+        baseline: List[dict],
+        tolerance: float,
+        min_delta: float = 0.05,
+        repeat: int = 5,
+        retries: int = 2,
+) -> List[dict]:
+    """
+    Measure the stages that look slower than the baseline again, up to retries
+    times, keeping the faster result, so that a burst of load on the machine
+    during one stage is not taken for a regression
+    :return: results with the re-measured stages replaced
+    """
+    before = {row["stage"]: row for row in baseline}
+    by_name = {name: (fn, items) for name, fn, items in stage_list}
+    results = list(results)
+    for _ in range(retries):
+        again = False
+        for k, row in enumerate(results):
+            old = before.get(row["stage"])
+            if not old or not _slower(row, old, tolerance, min_delta):
+                continue
+            again = True
+            fn, items = by_name[row["stage"]]
+            retry = summarize(row["stage"], measure(fn, items, repeat))
+            if retry["p50_ref"] < row["p50_ref"]:
+                results[k] = retry
+        if not again:
+            break
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the recognition and solving stages")
+    parser.add_argument("--pictures", default="test/*.jpg", help="glob of board pictures")
+    parser.add_argument(
+        "-r", "--repeat", type=int, default=5, help="timed passes over the inputs, after a warm-up"
+    )
+    parser.add_argument("--save", help="write the results as a JSON baseline")
+    parser.add_argument("--compare", help="JSON baseline to check against")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed p50 growth")
+    parser.add_argument(
+        "--min-delta", type=float, default=0.05, help="p50 growth in ms always allowed"
+    )
+    args = parser.parse_args(argv)
+
+    stage_list = stages(sorted(glob.glob(args.pictures)))
+    results = run(stage_list, args.repeat)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        results = recheck(
+            stage_list, results, baseline, args.tolerance, args.min_delta, args.repeat
+        )
+    print(f"{'stage':<20}{'count':>7}{'per sec':>12}{'p50 ms':>10}{'p99 ms':>10}")
+    for row in results:
+        print(
+            f"{row['stage']:<20}{row['count']:>7}{row['per_second']:>12.1f}"
+            f"{row['p50_ms']:>10.3f}{row['p99_ms']:>10.3f}"
+        )
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    failed = False
+    for message in check_batch():
+        print("SLOW BATCH", message, file=sys.stderr)
+        failed = True
+    if args.compare:
+        regressions = compare(results, baseline, args.tolerance, args.min_delta)
+        for message in regressions:
+            print("REGRESSION", message, file=sys.stderr)
+        failed = failed or bool(regressions)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
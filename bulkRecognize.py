@@ -0,0 +1,148 @@
+"""
+Recognize every board picture of a directory or glob pattern with a process pool,
+writing one JSON line per picture:
+
+    python bulkRecognize.py test/ -o boards.jsonl -j 4
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Iterable, Iterator
+
+from PIL import Image
+
+import constants
+import instrument
+from classifier import load_classifier
+from operateImage import BOARD_LOCATORS, recognize_board
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".gif", ".tif", ".tiff")
+
+_model_path = constants.MODEL_PATH
+_locator = None
+
+
+def iter_images(source: str) -> Iterator[str]:
+    """
+    Lazily list the pictures of a directory (sorted by name) or of a glob pattern
+    """
+    if os.path.isdir(source):
+        names = sorted(
+            entry.name
+            for entry in os.scandir(source)
+            if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        for name in names:
+            yield os.path.join(source, name)
+    else:
+        yield from glob.iglob(source, recursive=True)
+
+
+def _init_worker(model_path: str, locator: str = None):
+    global _model_path, _locator
+    _model_path = model_path
+    _locator = locator
+    load_classifier(model_path)
+
+
+def recognize_file(path: str) -> dict:
+    """
+    Run the whole recognition pipeline on one file
+    :return: JSON-serializable record with the board, confidences and timings
+    """
+    start = time.perf_counter()
+    try:
+        with Image.open(path) as img:
+            with instrument.stage("decode"):
+                img.load()
+            decoded = time.perf_counter()
+            result = recognize_board(img, load_classifier(_model_path), _locator)
+    except Exception as e:
+        return {"path": path, "error": f"{type(e).__name__}: {e}"}
+    end = time.perf_counter()
+    return {
+        "path": path,
+        "board": "".join(str(num) for num in result.board.ravel()),
+        "confidence": [round(float(c), 3) for c in result.confidence.ravel()],
+        "fail": result.fail,
+        "seconds": {
+            "decode": round(decoded - start, 6),
+            "recognize": round(end - decoded, 6),
+            "total": round(end - start, 6),
+        },
+    }
+
+
+def bulk_recognize(
+        paths: Iterable[str],
+        workers: int = None,
+        model_path: str = constants.MODEL_PATH,
+        max_pending: int = None,
+        locator: str = None,
+) -> Iterator[dict]:
+    """
+    Recognize pictures in parallel, yielding records as they complete.
+    At most max_pending pictures are queued at any time, so memory stays flat
+    however many paths are given.
+    :param paths: picture paths, can be a lazy iterator
+    :param workers: number of processes, defaults to the number of CPUs
+    :param model_path: training model loaded once in every worker
+    :param max_pending: defaults to 4 tasks per worker
+    :param locator: how the grid is found, see operateImage.locate_board
+    """
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or workers * 4
+    paths = iter(paths)
+    with ProcessPoolExecutor(
+            workers, initializer=_init_worker, initargs=(model_path, locator)
+    ) as pool:
+        pending = set()
+        for path in paths:
+            pending.add(pool.submit(recognize_file, path))
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recognize sudoku pictures in bulk")
+    parser.add_argument("source", help="directory or glob pattern of pictures")
+    parser.add_argument("-o", "--output", help="JSON Lines file, stdout by default")
+    parser.add_argument("-j", "--workers", type=int, help="number of processes")
+    parser.add_argument("-m", "--model", default=constants.MODEL_PATH, help="training model")
+    parser.add_argument(
+        "--locator", choices=BOARD_LOCATORS, help="use perspective for photographed boards"
+    )
+    args = parser.parse_args(argv)
+
+    out = open(args.output, "w") if args.output else sys.stdout
+    count = 0
+    start = time.perf_counter()
+    try:
+        for record in bulk_recognize(
+                iter_images(args.source), args.workers, args.model, locator=args.locator
+        ):
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+            count += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.perf_counter() - start
+    print(
+        f"{count} pictures in {elapsed:.2f}s ({count / max(elapsed, 1e-9):.1f}/s)",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import hashlib
+import os
+import pickle
+from typing import Any, Optional
+
+from PIL import Image
+
+import constants
+from classifier import KNNClassifier, load_classifier
+from memo import LRUCache
+from operateImage import RecognizedBoard, feature_settings, recognize_board
+
+
+class DiskCache:
+    """
+    One pickle file per entry in a directory. Once the files take more than
+    max_bytes, the least recently used ones (by mtime, refreshed on read) are deleted.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        # Running size of the entries; the directory is only scanned again once it
+        # goes over max_bytes
+        self.bytes = sum(size for _, size, _ in self._entries())
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".pkl")
+
+    def _entries(self) -> list:
+        """
+        (mtime, size, path) of every entry
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".pkl"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def get(self, key: str, default=None):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            self.misses += 1
+            return default
+        os.utime(path)
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        path = self._path(key)
+        temp = path + ".tmp"
+        with open(temp, "wb") as f:
+            pickle.dump(value, f)
+            size = f.tell()
+        try:
+            size -= os.stat(path).st_size
+        except OSError:
+            pass
+        os.replace(temp, path)
+        self.bytes += size
+        if self.bytes > self.max_bytes:
+            self._evict()
+
+    def _evict(self) -> None:
+        # Rescanned rather than trusted, other processes may share the directory
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self.bytes = total
+
+
+def image_key(img: Image.Image, classifier: KNNClassifier) -> str:
+    """
+    Hash of the decoded pixels together with everything else the recognition depends on
+    """
+    digest = hashlib.sha1()
+    digest.update(f"{img.mode}:{img.size}:".encode())
+    digest.update(img.tobytes())
+    settings = dict(feature_settings(), BOARD_LOCATOR=constants.BOARD_LOCATOR)
+    digest.update(
+        f":{classifier.fingerprint}:{sorted(settings.items())}"
+        f":{','.join(RecognizedBoard._fields)}".encode()
+    )
+    return digest.hexdigest()
+
+
+class RecognitionCache:
+    """
+    Results of recognize_board keyed by image content, with an in-memory LRU tier
+    and an optional on-disk tier behind it
+    """
+
+    def __init__(
+            self,
+            max_size: int = 256,
+            directory: Optional[str] = None,
+            max_bytes: int = 64 * 1024 * 1024,
+    ):
+        """
+        :param max_size: number of boards kept in memory
+        :param directory: directory of the on-disk tier, None to keep memory only
+        :param max_bytes: size limit of the on-disk tier
+        """
+        self.memory = LRUCache(max_size)
+        self.disk = DiskCache(directory, max_bytes) if directory else None
+
+    def recognize(self, board: Image.Image, classifier: KNNClassifier = None) -> RecognizedBoard:
+        """
+        Same as operateImage.recognize_board, answered from the cache when the
+        same picture was recognized before
+        """
+        if classifier is None:
+            classifier = load_classifier()
+        key = image_key(board, classifier)
+        result = self.memory.get(key)
+        if result is not None:
+            return result
+        if self.disk is not None:
+            result = self.disk.get(key)
+            if result is not None:
+                self.memory.put(key, result)
+                return result
+        result = recognize_board(board, classifier)
+        self.memory.put(key, result)
+        if self.disk is not None:
+            self.disk.put(key, result)
+        return result
+
+    def stats(self) -> dict:
+        """
+        Hit and miss counters of every tier, for monitoring
+        """
+        out = {
+            "memory_hits": self.memory.hits,
+            "memory_misses": self.memory.misses,
+            "memory_size": len(self.memory),
+        }
+        if self.disk is not None:
+            out["disk_hits"] = self.disk.hits
+            out["disk_misses"] = self.disk.misses
+        return out
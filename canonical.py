@@ -0,0 +1,159 @@
+import itertools
+from typing import List, NamedTuple, Tuple
+
+import numpy as np
+
+from solver import Puzzle, parse_puzzle
+
+# Line orders that keep sudoku validity: the 3 bands (stacks) in any order and
+# the 3 rows (columns) inside each band in any order, 6 * 6 ** 3 = 1296 of them
+LINE_ORDERS = np.array(
+    [
+        [band * 3 + line for band, lines in zip(bands, inner) for line in lines]
+        for bands in itertools.permutations(range(3))
+        for inner in itertools.product(itertools.permutations(range(3)), repeat=3)
+    ],
+    dtype=np.intp,
+)
+_TRIPLE_ORDERS = list(itertools.permutations(range(3)))
+# Band (stack) and inner order index at each of the 3 positions of every line order
+_BAND_AT = LINE_ORDERS[:, ::3] // 3
+_INNER_AT = np.array(
+    [
+        [_TRIPLE_ORDERS.index(tuple(order[k * 3:k * 3 + 3] % 3)) for k in range(3)]
+        for order in LINE_ORDERS
+    ]
+)
+# _REORDER[p, bits]: 3-bit pattern (first column as the high bit) after reordering by permutation p
+_REORDER = np.array(
+    [
+        [sum(((bits >> (2 - p[m])) & 1) << (2 - m) for m in range(3)) for bits in range(8)]
+        for p in _TRIPLE_ORDERS
+    ]
+)
+
+# Past this many equally good layouts the first ones found are compared only,
+# which keeps very symmetric (nearly empty or full) grids cheap. The result is
+# still an equivalent puzzle, it just may not be the same for all variants.
+MAX_CANDIDATES = 20000
+
+
+class Transform(NamedTuple):
+    """
+    A symmetry of sudoku: canonical[k] = digits[original[cells[k]]]
+    """
+
+    cells: Tuple[int, ...]
+    digits: Tuple[int, ...]
+
+    def apply(self, flat: List[int]) -> List[int]:
+        return [self.digits[flat[cell]] for cell in self.cells]
+
+    def invert(self, flat: List[int]) -> List[int]:
+        """
+        Map a grid in canonical layout (e.g. the canonical solution) back
+        """
+        inverse_digits = [0] * 10
+        for digit, label in enumerate(self.digits):
+            inverse_digits[label] = digit
+        out = [0] * 81
+        for k, cell in enumerate(self.cells):
+            out[cell] = inverse_digits[flat[k]]
+        return out
+
+
+def _best_row_orders(values: np.ndarray) -> List[List[int]]:
+    """
+    Every row order reaching the lexicographically smallest sequence of row values
+    """
+    bands = []
+    for band in range(3):
+        rows = sorted(range(band * 3, band * 3 + 3), key=lambda r: values[r])
+        orders = [
+            list(p) for p in itertools.permutations(rows)
+            if [values[r] for r in p] == [values[r] for r in rows]
+        ]
+        bands.append((tuple(values[r] for r in rows), orders))
+    bands.sort(key=lambda b: b[0])
+    band_orders = [
+        p for p in itertools.permutations(bands)
+        if [b[0] for b in p] == [b[0] for b in bands]
+    ]
+    out = []
+    for order in band_orders:
+        for rows in itertools.product(*(b[1] for b in order)):
+            out.append([r for band in rows for r in band])
+    return out
+
+
+def canonicalize(puzzle: Puzzle) -> Tuple[List[int], Transform]:
+    """
+    Map a puzzle to the representative of its class under transposition, band
+    and stack swaps, row and column swaps inside them and digit relabeling.
+    Puzzles related by those symmetries share the representative.
+    :return: flat canonical puzzle and the transform producing it
+    """
+    flat = np.array(parse_puzzle(puzzle), dtype=np.uint8)
+    grid = flat.reshape(9, 9)
+
+    # Stage 1: smallest filled-cell pattern, read row by row
+    layouts = []
+    best = None
+    for transposed in (False, True):
+        mask = ((grid.T if transposed else grid) != 0).astype(np.intp)
+        # 3-bit pattern of every row inside every stack
+        chunks = (mask[:, 0::3] << 2) | (mask[:, 1::3] << 1) | mask[:, 2::3]
+        # values[c, r]: pattern of row r under column order c as a 9-bit number
+        values = (
+                (_REORDER[_INNER_AT[:, 0:1], chunks[:, _BAND_AT[:, 0]].T] << 6)
+                | (_REORDER[_INNER_AT[:, 1:2], chunks[:, _BAND_AT[:, 1]].T] << 3)
+                | _REORDER[_INNER_AT[:, 2:3], chunks[:, _BAND_AT[:, 2]].T]
+        )
+        triples = np.sort(values.reshape(-1, 3, 3), axis=2)
+        band_keys = np.sort(
+            (triples[:, :, 0] << 18) | (triples[:, :, 1] << 9) | triples[:, :, 2], axis=1
+        )
+        for c in np.lexsort(band_keys.T[::-1]):
+            key = tuple(band_keys[c])
+            if best is not None and key > best:
+                break
+            if best is None or key < best:
+                best, layouts = key, []
+            layouts.append((transposed, c, values[c]))
+
+    candidates = []
+    for transposed, c, values in layouts:
+        columns = LINE_ORDERS[c]
+        for rows in _best_row_orders(values):
+            if transposed:
+                cells = (columns[None, :] * 9 + np.array(rows)[:, None]).ravel()
+            else:
+                cells = (np.array(rows)[:, None] * 9 + columns[None, :]).ravel()
+            candidates.append(cells)
+            if len(candidates) >= MAX_CANDIDATES:
+                break
+        if len(candidates) >= MAX_CANDIDATES:
+            break
+
+    # Stage 2: smallest grid after numbering digits by first appearance
+    cells = np.array(candidates)
+    laid = flat[cells]
+    present = laid[:, :, None] == np.arange(1, 10)
+    first = np.where(present.any(axis=1), present.argmax(axis=1), 81)
+    rank = np.argsort(np.argsort(first, axis=1, kind="stable"), axis=1, kind="stable") + 1
+    labels = np.concatenate([np.zeros((len(cells), 1), dtype=rank.dtype), rank], axis=1)
+    relabeled = np.take_along_axis(labels, laid.astype(np.intp), axis=1).astype(np.uint8)
+    winner = min(range(len(cells)), key=lambda k: relabeled[k].tobytes())
+
+    transform = Transform(
+        tuple(int(cell) for cell in cells[winner]),
+        tuple(int(label) for label in labels[winner]),
+    )
+    return relabeled[winner].tolist(), transform
+
+
+def canonical_key(puzzle: Puzzle) -> str:
+    """
+    81-char string identifying the equivalence class of a puzzle
+    """
+    return "".join(map(str, canonicalize(puzzle)[0]))
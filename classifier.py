@@ -0,0 +1,145 @@
+import hashlib
+import pickle
+from functools import lru_cache
+from typing import Tuple
+
+import numpy as np
+from numpy import ndarray
+
+import constants
+from model import is_binary_model, load_model
+
+BACKENDS = ("brute", "kdtree", "balltree")
+
+
+class KNNClassifier:
+    """
+    k nearest neighbours over the training features, stored as one contiguous
+    float32 matrix so that a whole batch of cells is classified at once
+    """
+
+    features: ndarray
+    labels: ndarray
+
+    def __init__(
+            self, features: ndarray, labels: ndarray, k: int = 10, backend: str = "brute"
+    ):
+        """
+        :param features: (n, d) training feature vectors
+        :param labels: (n,) digit of each training vector
+        :param k: number of neighbours taking part in the vote
+        :param backend: one of BACKENDS; "kdtree" needs scipy and "balltree" needs scikit-learn
+        """
+        if backend not in BACKENDS:
+            raise ValueError("Unknown backend: " + str(backend))
+        self.features = np.ascontiguousarray(features, dtype=np.float32)
+        self.labels = np.ascontiguousarray(labels, dtype=np.uint8)
+        assert self.features.ndim == 2 and len(self.features) == len(self.labels)
+        self.k = min(k, len(self.labels))
+        self.backend = backend
+        self._squared_norms = (self.features ** 2).sum(axis=1)
+        self._tree = None
+        self._fingerprint = None
+        if backend == "kdtree":
+            from scipy.spatial import cKDTree
+
+            self._tree = cKDTree(self.features)
+        elif backend == "balltree":
+            from sklearn.neighbors import BallTree
+
+            self._tree = BallTree(self.features)
+
+    @classmethod
+    def from_train_set(cls, train_set: dict, k: int = 10, backend: str = "brute"):
+        """
+        Build from the {digit: [feature, ...]} dict written by train.train
+        """
+        features = [vec for num in train_set for vec in train_set[num]]
+        labels = [num for num in train_set for _ in train_set[num]]
+        return cls(np.array(features), np.array(labels), k, backend)
+
+    @classmethod
+    def load(cls, path: str = constants.MODEL_PATH, k: int = 10, backend: str = "brute"):
+        """
+        Load a binary model (memory mapped, see model.py) or an old pickled one
+        """
+        if is_binary_model(path):
+            features, labels = load_model(path)
+            return cls(features, labels, k, backend)
+        with open(path, "rb") as f:
+            return cls.from_train_set(pickle.load(f), k, backend)
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        Hash of the training data and k, identifies the model in caches
+        """
+        if self._fingerprint is None:
+            digest = hashlib.sha1(self.features.tobytes())
+            digest.update(self.labels.tobytes())
+            digest.update(str(self.k).encode())
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    def kneighbors(self, queries: ndarray) -> Tuple[ndarray, ndarray]:
+        """
+        Find the k nearest training vectors of every query
+        :param queries: (m, d) or (d,) feature vectors
+        :return: distances and labels, both (m, k) and sorted by distance
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if self._tree is not None:
+            dist, index = self._tree.query(queries, k=self.k)
+            dist, index = dist.reshape(len(queries), -1), index.reshape(len(queries), -1)
+            return dist.astype(np.float32), self.labels[index]
+
+        # |q - f|^2 = |q|^2 + |f|^2 - 2 q.f for every pair in one product
+        squared = (
+                (queries ** 2).sum(axis=1)[:, None]
+                + self._squared_norms[None, :]
+                - 2 * queries @ self.features.T
+        )
+        np.maximum(squared, 0, out=squared)
+        if self.k < squared.shape[1]:
+            index = np.argpartition(squared, self.k - 1, axis=1)[:, :self.k]
+        else:
+            index = np.broadcast_to(np.arange(squared.shape[1]), squared.shape)
+        nearest = np.take_along_axis(squared, index, axis=1)
+        order = np.argsort(nearest, axis=1, kind="stable")
+        index = np.take_along_axis(index, order, axis=1)
+        dist = np.sqrt(np.take_along_axis(nearest, order, axis=1))
+        return dist, self.labels[index]
+
+    def votes(self, queries: ndarray) -> ndarray:
+        """
+        :return: (m, 10) array, votes[i, num] is how many neighbours of query i are digit num
+        """
+        _, labels = self.kneighbors(queries)
+        counts = np.zeros((len(labels), 10), dtype=np.intp)
+        np.add.at(counts, (np.arange(len(labels))[:, None], labels), 1)
+        return counts
+
+    def top(self, queries: ndarray, n: int = 3):
+        """
+        The n digits with the most votes, the smaller digit first on a tie
+        :return: (m, n) digits and (m, n) share of the k neighbours voting for each
+        """
+        votes = self.votes(queries)
+        digits = np.argsort(-votes, axis=1, kind="stable")[:, :n]
+        shares = np.take_along_axis(votes, digits, axis=1) / votes.sum(axis=1, keepdims=True)
+        return digits, shares
+
+    def predict(self, queries: ndarray) -> ndarray:
+        """
+        Majority vote of the k nearest neighbours, the smaller digit wins a tie
+        :return: (m,) array of digits
+        """
+        return self.votes(queries).argmax(axis=1)
+
+
+@lru_cache(maxsize=None)
+def load_classifier(path: str = constants.MODEL_PATH, k: int = 10, backend: str = "brute"):
+    """
+    Load a classifier once per process and share it between calls
+    """
+    return KNNClassifier.load(path, k, backend)
@@ -1 +1,34 @@
 BLACK_SENSITIVE = 100
+
+# Backend solving puzzles in the app, "python" (in process) or "java" (javaGame.Board
+# through jpype, the JVM is started on first use); see backends.py
+SOLVER_BACKEND = "python"
+
+# Training model written by train.py (binary, see model.py; old pickles still load)
+MODEL_PATH = "train.module"
+# Per-picture features kept between training runs
+TRAIN_CACHE_PATH = "train.cache"
+
+# Binarization: "fixed" uses BLACK_SENSITIVE, "otsu" picks the threshold from the
+# histogram, "adaptive" compares each pixel with the mean of its neighbourhood.
+BINARIZE_MODE = "fixed"
+ADAPTIVE_BLOCK_SIZE = 15
+ADAPTIVE_OFFSET = 10
+
+# How recognition finds the grid in a picture: "axis" for straight screenshots,
+# "perspective" for skewed or rotated photos (see operateImage.locate_board)
+BOARD_LOCATOR = "axis"
+
+# Recognized digits with a smaller share of the neighbour votes are doubtful and
+# may be corrected to a runner-up reading (see disambiguate.py)
+CONFIDENCE_THRESHOLD = 0.9
+
+# Zones per side of the cell feature (FEATURE_GRID ** 2 + 1 values); train.module
+# was trained with 10, a model must be retrained when this changes
+FEATURE_GRID = 10
+
+# Pre-generated puzzles drawn by "Random Generate", see corpus.py
+CORPUS_PATH = "puzzles.corpus"
+
+# Directory of the on-disk tier of the recognition cache, None keeps it in memory only
+RECOGNITION_CACHE_DIR = None
@@ -0,0 +1,176 @@
+"""
+Pre-rated puzzle corpus. Generate one with a process pool:
+
+    python corpus.py 10000 -o puzzles.corpus -j 4 --difficulty hard
+
+File layout: an 8 byte header (magic, version), one uint32 record count per
+difficulty, then the records grouped by difficulty. A record is 83 bytes: the
+puzzle and the solution as 81 digits packed two per byte, and the difficulty.
+"""
+import argparse
+import os
+import random
+import struct
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Iterable, Iterator, List, Optional
+
+import constants
+from canonical import canonical_key
+from generator import DIFFICULTIES, Generated, generate
+
+MAGIC = b"SDKC"
+VERSION = 1
+_HEADER = struct.Struct("<4sB3x" + "I" * len(DIFFICULTIES))
+PACKED_SIZE = 41
+RECORD_SIZE = PACKED_SIZE * 2 + 1
+
+
+def pack_digits(flat: List[int]) -> bytes:
+    """
+    81 digits into 41 bytes, high nibble first
+    """
+    padded = list(flat) + [0]
+    return bytes((padded[i] << 4) | padded[i + 1] for i in range(0, 82, 2))
+
+
+def unpack_digits(data: bytes) -> List[int]:
+    out = []
+    for byte in data:
+        out.append(byte >> 4)
+        out.append(byte & 0xF)
+    return out[:81]
+
+
+def write_corpus(path: str, records: Iterable[Generated]):
+    """
+    Write records grouped by difficulty, replacing the file atomically
+    """
+    groups = [[] for _ in DIFFICULTIES]
+    for record in records:
+        groups[record.difficulty].append(record)
+    temp = path + ".tmp"
+    with open(temp, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, *(len(group) for group in groups)))
+        for group in groups:
+            for record in group:
+                f.write(pack_digits(record.puzzle))
+                f.write(pack_digits(record.solution))
+                f.write(bytes((record.difficulty,)))
+    os.replace(temp, path)
+
+
+def _decode(data: bytes) -> Generated:
+    return Generated(
+        unpack_digits(data[:PACKED_SIZE]),
+        unpack_digits(data[PACKED_SIZE:PACKED_SIZE * 2]),
+        data[-1],
+    )
+
+
+class Corpus:
+    """
+    Random access to a corpus file; records are read on demand
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            magic, version, *counts = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a puzzle corpus: " + path)
+        self.counts = counts
+        self.offsets = [sum(counts[:i]) for i in range(len(counts))]
+
+    def __len__(self):
+        return sum(self.counts)
+
+    def __getitem__(self, index: int) -> Generated:
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        with open(self.path, "rb") as f:
+            f.seek(_HEADER.size + index * RECORD_SIZE)
+            return _decode(f.read(RECORD_SIZE))
+
+    def __iter__(self) -> Iterator[Generated]:
+        with open(self.path, "rb") as f:
+            f.seek(_HEADER.size)
+            for _ in range(len(self)):
+                yield _decode(f.read(RECORD_SIZE))
+
+    def random(self, difficulty: Optional[str] = None, rng=random) -> Optional[Generated]:
+        """
+        Draw a puzzle, from one difficulty band if given
+        :return: None if the corpus holds no matching puzzle
+        """
+        if difficulty is None:
+            return self[rng.randrange(len(self))] if len(self) else None
+        level = DIFFICULTIES.index(difficulty)
+        if not self.counts[level]:
+            return None
+        return self[self.offsets[level] + rng.randrange(self.counts[level])]
+
+
+def _generate_chunk(size: int, difficulty: Optional[str], seed: int) -> List[Generated]:
+    rng = random.Random(seed)
+    return [generate(difficulty, rng=rng) for _ in range(size)]
+
+
+def generate_corpus(
+        count: int,
+        difficulty: Optional[str] = None,
+        workers: int = None,
+        chunk_size: int = 20,
+        seed: int = None,
+) -> Iterator[Generated]:
+    """
+    Generate count puzzles that are pairwise not equivalent under sudoku symmetries
+    :param count: number of puzzles
+    :param difficulty: one of generator.DIFFICULTIES, any if None
+    :param workers: number of processes, defaults to the number of CPUs
+    :param chunk_size: puzzles per task
+    :param seed: base seed for reproducible corpora
+    """
+    workers = workers or os.cpu_count() or 1
+    seeds = random.Random(seed)
+    seen = set()
+    with ProcessPoolExecutor(workers) as pool:
+        pending = set()
+        while len(seen) < count:
+            while len(pending) < workers * 2:
+                pending.add(
+                    pool.submit(_generate_chunk, chunk_size, difficulty, seeds.getrandbits(64))
+                )
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                for record in future.result():
+                    key = canonical_key(record.puzzle)
+                    if len(seen) < count and key not in seen:
+                        seen.add(key)
+                        yield record
+        for future in pending:
+            future.cancel()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a corpus of unique puzzles")
+    parser.add_argument("count", type=int, help="number of puzzles")
+    parser.add_argument("-o", "--output", default=constants.CORPUS_PATH)
+    parser.add_argument("-d", "--difficulty", choices=DIFFICULTIES)
+    parser.add_argument("-j", "--workers", type=int, help="number of processes")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    records = list(generate_corpus(args.count, args.difficulty, args.workers, seed=args.seed))
+    write_corpus(args.output, records)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{len(records)} puzzles in {elapsed:.2f}s ({len(records) / max(elapsed, 1e-9):.1f}/s)",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+from typing import Optional, Tuple
+
+import numpy as np
+from numpy import ndarray
+
+
+def longest_runs(flags: ndarray, axis: int = 1) -> ndarray:
+    """
+    Length of the longest run of True values along an axis of a 2d bool array
+    :param flags: 2d bool array
+    :param axis: 1 for one value per row, 0 for one value per column
+    :return: int array with one entry per row (axis=1) or per column (axis=0)
+    """
+    if axis == 0:
+        flags = flags.T
+    height, width = flags.shape
+    padded = np.zeros((height, width + 2), dtype=np.int8)
+    padded[:, 1:-1] = flags
+    edges = np.diff(padded, axis=1)
+    # Rows are scanned in order, so the k-th start and the k-th end belong to the same run
+    start_rows, start_columns = np.nonzero(edges == 1)
+    _, end_columns = np.nonzero(edges == -1)
+    out = np.zeros(height, dtype=np.intp)
+    np.maximum.at(out, start_rows, end_columns - start_columns)
+    return out
+
+
+def longest_run(line: ndarray, filled: int = 1) -> int:
+    """
+    Length of the longest run of `filled` in a 1d array
+    """
+    return int(longest_runs(np.asarray(line).reshape(1, -1) == filled)[0])
+
+
+def run_bounds(flags: ndarray) -> Tuple[ndarray, ndarray]:
+    """
+    Every run of True values in a 1d bool array
+    :return: start and stop (exclusive) indices of the runs, in order
+    """
+    padded = np.zeros(len(flags) + 2, dtype=np.int8)
+    padded[1:-1] = flags
+    edges = np.diff(padded)
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def scan_border(
+        flags: ndarray, start: int, stop: int, default: Optional[int] = None
+) -> Optional[int]:
+    """
+    Walk flags from start towards stop (exclusive, either direction) and return
+    the first index that is True, default if there is none
+    """
+    if start >= stop:
+        indices = np.arange(start, stop, -1)
+    else:
+        indices = np.arange(start, stop)
+    indices = indices[(indices >= 0) & (indices < len(flags))]
+    hits = indices[flags[indices]]
+    if hits.size:
+        return int(hits[0])
+    return default
+
+
+class BorderRuns:
+    """
+    Longest run of filled pixels for every row and every column of a binary mask,
+    computed once so that cropping loops can query them without rescanning slices
+    """
+
+    rows: ndarray
+    columns: ndarray
+
+    def __init__(self, mask: ndarray, filled: int = 1):
+        """
+        :param mask: 2d array of 0 and 1 (see operateImage.binarize)
+        :param filled: the value counted as part of a border
+        """
+        flags = mask == filled
+        self.shape = mask.shape
+        self.rows = longest_runs(flags, axis=1)
+        self.columns = longest_runs(flags, axis=0)
+
+    def row_borders(self, min_boarder_length: float) -> ndarray:
+        """
+        :return: bool array, True for rows holding a run of at least min_boarder_length * width
+        """
+        return self.rows >= self.shape[1] * min_boarder_length
+
+    def column_borders(self, min_boarder_length: float) -> ndarray:
+        """
+        :return: bool array, True for columns holding a run of at least min_boarder_length * height
+        """
+        return self.columns >= self.shape[0] * min_boarder_length
@@ -0,0 +1,112 @@
+"""
+Settle doubtful digits of a recognized board with the solver. A misread digit
+almost always leaves the grid without a solution or with several, while the
+right reading has exactly one, so the runner-up digits of the least certain
+cells are tried, most likely first, until the grid has a unique solution.
+"""
+import itertools
+import math
+from collections import namedtuple
+from typing import List, Tuple
+
+import constants
+import dlx
+import instrument
+import solver
+from operateImage import RecognizedBoard
+
+Resolved = namedtuple("Resolved", ["board", "changed", "solutions"])
+
+
+def conflicting_cells(flat: List[int]) -> set:
+    """
+    Indices of the cells whose digit is repeated in their row, column or box
+    """
+    out = set()
+    for unit in solver.UNITS:
+        seen = {}
+        for i in unit:
+            if flat[i]:
+                seen.setdefault(flat[i], []).append(i)
+        for cells in seen.values():
+            if len(cells) > 1:
+                out.update(cells)
+    return out
+
+
+def _options(result: RecognizedBoard, threshold: float, max_cells: int) -> List[Tuple]:
+    """
+    Possible corrections as (cost, index, digit), cost being how much less likely
+    the digit is than the one read (log of the ratio of their votes)
+    """
+    flat = result.board.ravel().tolist()
+    shares = result.shares.reshape(81, -1)
+    candidates = result.candidates.reshape(81, -1)
+    conflicts = conflicting_cells(flat)
+    doubtful = [
+        i for i in range(81)
+        if flat[i] and (shares[i, 0] < threshold or i in conflicts)
+    ]
+    # Closest votes first: those are the likeliest misreads
+    doubtful.sort(key=lambda i: shares[i, 0] - shares[i, 1])
+    out = []
+    for i in doubtful[:max_cells]:
+        for digit, share in zip(candidates[i, 1:], shares[i, 1:]):
+            if share > 0 and digit:
+                out.append((math.log(shares[i, 0] / share), i, int(digit)))
+    return out
+
+
+def resolve(
+        result: RecognizedBoard,
+        threshold: float = None,
+        max_cells: int = 12,
+        max_changes: int = 2,
+        max_tries: int = 500,
+) -> Resolved:
+    """
+    Correct a recognized board so that it has a unique solution, if changing a few
+    doubtful digits to their runner-up readings can achieve that
+    :param result: see operateImage.recognize_board
+    :param threshold: digits whose vote share is below it are doubtful (digits in
+                      conflict always are), defaults to constants.CONFIDENCE_THRESHOLD
+    :param max_cells: doubtful cells considered, those with the closest votes first
+    :param max_changes: digits changed at most at once
+    :param max_tries: solver calls at most
+    :return: Resolved with
+             board: 9 * 9 list of digits, the corrected board or the one read;
+             changed: list of (row, column, digit read, digit used);
+             solutions: solutions of the returned board, counted up to 2
+    """
+    if threshold is None:
+        threshold = constants.CONFIDENCE_THRESHOLD
+    flat = result.board.ravel().tolist()
+    count = dlx.count_solutions(flat)
+    if count == 1:
+        return Resolved(solver.to_board(flat), [], 1)
+
+    with instrument.stage("disambiguate"):
+        options = _options(result, threshold, max_cells)
+        combos = [
+            combo
+            for n in range(1, max_changes + 1)
+            for combo in itertools.combinations(options, n)
+            if len({i for _, i, _ in combo}) == n
+        ]
+        combos.sort(key=lambda combo: sum(cost for cost, _, _ in combo))
+
+        tries = 0
+        for combo in combos:
+            trial = flat[:]
+            for _, i, digit in combo:
+                trial[i] = digit
+            if conflicting_cells(trial):
+                continue
+            tries += 1
+            if dlx.count_solutions(trial) == 1:
+                instrument.count("cells_corrected", len(combo))
+                changed = [(i // 9, i % 9, flat[i], digit) for _, i, digit in combo]
+                return Resolved(solver.to_board(trial), changed, 1)
+            if tries >= max_tries:
+                break
+    return Resolved(solver.to_board(flat), [], count)
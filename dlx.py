@@ -0,0 +1,181 @@
+from typing import Iterator, List, Optional
+
+from solver import BOX, Board, Puzzle, parse_puzzle, to_board
+
+# Exact cover matrix of sudoku: 324 columns (cell filled, digit in row, digit in
+# column, digit in box) and 729 rows (one per cell and digit), 4 nodes per row.
+# Node 0 is the root, nodes 1..324 are column headers, then 4 nodes per candidate.
+COLUMNS = 324
+FIRST_NODE = COLUMNS + 1
+
+
+def _candidate_columns(candidate: int) -> List[int]:
+    cell, digit = divmod(candidate, 9)
+    row, col = divmod(cell, 9)
+    return [
+        1 + cell,
+        1 + 81 + row * 9 + digit,
+        1 + 162 + col * 9 + digit,
+        1 + 243 + BOX[cell] * 9 + digit,
+    ]
+
+
+def _build_template():
+    size = FIRST_NODE + 729 * 4
+    left, right = list(range(-1, size - 1)), list(range(1, size + 1))
+    up, down = list(range(size)), list(range(size))
+    column = list(range(size))
+    left[0], right[COLUMNS] = COLUMNS, 0
+    counts = [0] * FIRST_NODE
+    for candidate in range(729):
+        first = FIRST_NODE + candidate * 4
+        for offset, col in enumerate(_candidate_columns(candidate)):
+            node = first + offset
+            left[node] = first + (offset - 1) % 4
+            right[node] = first + (offset + 1) % 4
+            # Append at the bottom of the column
+            column[node] = col
+            up[node], down[node] = up[col], col
+            down[up[col]] = node
+            up[col] = node
+            counts[col] += 1
+    return left, right, up, down, column, counts
+
+
+_TEMPLATE = _build_template()
+
+
+class DancingLinks:
+    """
+    Algorithm X over array-backed dancing links. Every link lives in a flat list
+    indexed by node number, so a fresh matrix is just a copy of the template lists.
+    """
+
+    def __init__(self, puzzle: Puzzle):
+        """
+        :param puzzle: see solver.parse_puzzle
+        """
+        self.left, self.right, self.up, self.down, self.column, self.counts = (
+            list(links) for links in _TEMPLATE
+        )
+        self.givens = parse_puzzle(puzzle)
+        self.valid = True
+        covered = set()
+        for cell, num in enumerate(self.givens):
+            if not num:
+                continue
+            columns = _candidate_columns(cell * 9 + num - 1)
+            if covered.intersection(columns):
+                self.valid = False
+                return
+            covered.update(columns)
+            for col in columns:
+                self._cover(col)
+
+    def _cover(self, col: int):
+        left, right, up, down, column, counts = (
+            self.left, self.right, self.up, self.down, self.column, self.counts
+        )
+        right[left[col]] = right[col]
+        left[right[col]] = left[col]
+        i = down[col]
+        while i != col:
+            j = right[i]
+            while j != i:
+                down[up[j]] = down[j]
+                up[down[j]] = up[j]
+                counts[column[j]] -= 1
+                j = right[j]
+            i = down[i]
+
+    def _uncover(self, col: int):
+        left, right, up, down, column, counts = (
+            self.left, self.right, self.up, self.down, self.column, self.counts
+        )
+        i = up[col]
+        while i != col:
+            j = left[i]
+            while j != i:
+                counts[column[j]] += 1
+                down[up[j]] = j
+                up[down[j]] = j
+                j = left[j]
+            i = up[i]
+        right[left[col]] = col
+        left[right[col]] = col
+
+    def _search(self, chosen: list) -> Iterator[list]:
+        right, down, column, counts = self.right, self.down, self.column, self.counts
+        if right[0] == 0:
+            yield chosen
+            return
+
+        # Branch on the column with the fewest remaining rows
+        col, best = 0, 730
+        c = right[0]
+        while c:
+            if counts[c] < best:
+                col, best = c, counts[c]
+                if best <= 1:
+                    break
+            c = right[c]
+        if not best:
+            return
+
+        self._cover(col)
+        r = down[col]
+        while r != col:
+            chosen.append(r)
+            j = right[r]
+            while j != r:
+                self._cover(column[j])
+                j = right[j]
+            yield from self._search(chosen)
+            j = self.left[r]
+            while j != r:
+                self._uncover(column[j])
+                j = self.left[j]
+            chosen.pop()
+            r = down[r]
+        self._uncover(col)
+
+    def solutions(self) -> Iterator[List[int]]:
+        """
+        Generate every solution as a flat list of 81 digits
+        """
+        if not self.valid:
+            return
+        for chosen in self._search([]):
+            flat = self.givens[:]
+            for node in chosen:
+                cell, digit = divmod((node - FIRST_NODE) // 4, 9)
+                flat[cell] = digit + 1
+            yield flat
+
+
+def enumerate_solutions(puzzle: Puzzle) -> Iterator[Board]:
+    """
+    Generate every solution of a puzzle as a 9 * 9 2d array
+    """
+    for flat in DancingLinks(puzzle).solutions():
+        yield to_board(flat)
+
+
+def solve(puzzle: Puzzle) -> Optional[Board]:
+    """
+    :return: first solution as a 9 * 9 2d array, None if there is none
+    """
+    return next(enumerate_solutions(puzzle), None)
+
+
+def count_solutions(puzzle: Puzzle, limit: int = 2) -> int:
+    """
+    Count solutions, stopping once limit is reached. With the default limit
+    the result tells apart unsolvable (0), unique (1) and ambiguous (2) puzzles.
+    """
+    count = 0
+    for _ in DancingLinks(puzzle).solutions():
+        count += 1
+        if count >= limit:
+            break
+    return count
@@ -0,0 +1,206 @@
+import random
+from typing import List, NamedTuple, Optional
+
+import dlx
+from solver import ALL, BOX, COL, POPCOUNT, ROW, UNITS, Puzzle, parse_puzzle, solve_flat
+
+# Difficulty is the hardest technique a human-style solve needs
+DIFFICULTIES = ("easy", "medium", "hard", "expert")
+EASY, MEDIUM, HARD, EXPERT = range(4)
+
+_ROW_UNITS, _COL_UNITS, _BOX_UNITS = UNITS[:9], UNITS[9:18], UNITS[18:]
+
+
+class Generated(NamedTuple):
+    puzzle: List[int]
+    solution: List[int]
+    difficulty: int
+
+
+def rate(puzzle: Puzzle) -> int:
+    """
+    Rate a puzzle by the techniques needed to solve it without guessing:
+    EASY needs naked singles only, MEDIUM also hidden singles, HARD also locked
+    candidates and naked pairs, EXPERT cannot be finished with them
+    """
+    flat = parse_puzzle(puzzle)
+    rows, cols, boxes = [0] * 9, [0] * 9, [0] * 9
+    cells = [0] * 81
+    for i, num in enumerate(flat):
+        if num:
+            bit = 1 << (num - 1)
+            cells[i] = bit
+            rows[ROW[i]] |= bit
+            cols[COL[i]] |= bit
+            boxes[BOX[i]] |= bit
+    # Candidates removed by eliminations on top of the placed digits
+    removed = [0] * 81
+    level = EASY
+
+    def candidates(cell):
+        return ALL & ~(rows[ROW[cell]] | cols[COL[cell]] | boxes[BOX[cell]] | removed[cell])
+
+    def place(cell, bit):
+        cells[cell] = bit
+        rows[ROW[cell]] |= bit
+        cols[COL[cell]] |= bit
+        boxes[BOX[cell]] |= bit
+
+    while not all(cells):
+        empty = [i for i in range(81) if not cells[i]]
+        cand = {i: candidates(i) for i in empty}
+        if not all(cand.values()):
+            return EXPERT
+
+        singles = [i for i in empty if POPCOUNT[cand[i]] == 1]
+        if singles:
+            for i in singles:
+                if candidates(i) & cand[i]:
+                    place(i, cand[i])
+            continue
+
+        found = False
+        for unit in UNITS:
+            once = twice = 0
+            for i in unit:
+                if not cells[i]:
+                    twice |= once & cand[i]
+                    once |= cand[i]
+            hidden = once & ~twice
+            for i in unit:
+                if hidden and not cells[i] and cand[i] & hidden:
+                    place(i, cand[i] & hidden & -(cand[i] & hidden))
+                    found = True
+            if found:
+                break
+        if found:
+            level = max(level, MEDIUM)
+            continue
+
+        if _locked_candidates(cand, removed) or _naked_pairs(cand, removed):
+            level = max(level, HARD)
+            continue
+        return EXPERT
+    return level
+
+
+def _locked_candidates(cand: dict, removed: list) -> bool:
+    """
+    Pointing and claiming: a digit confined to one line inside a box (or to one
+    box inside a line) is removed from the rest of that line (or box)
+    """
+    progress = False
+    for box in _BOX_UNITS:
+        for lines in (_ROW_UNITS, _COL_UNITS):
+            for line in lines:
+                inside = [i for i in box if i in cand and i in line]
+                if not inside:
+                    continue
+                box_rest = [i for i in box if i in cand and i not in line]
+                line_rest = [i for i in line if i in cand and i not in box]
+                here = 0
+                for i in inside:
+                    here |= cand[i]
+                box_other = line_other = 0
+                for i in box_rest:
+                    box_other |= cand[i]
+                for i in line_rest:
+                    line_other |= cand[i]
+                pointing = here & ~box_other & line_other
+                claiming = here & ~line_other & box_other
+                for targets, bits in ((line_rest, pointing), (box_rest, claiming)):
+                    if not bits:
+                        continue
+                    for i in targets:
+                        if cand[i] & bits:
+                            removed[i] |= bits
+                            cand[i] &= ~bits
+                            progress = True
+    return progress
+
+
+def _naked_pairs(cand: dict, removed: list) -> bool:
+    """
+    Two cells of a unit holding the same two candidates remove them from the rest of the unit
+    """
+    progress = False
+    for unit in UNITS:
+        pairs = {}
+        for i in unit:
+            if i in cand and POPCOUNT[cand[i]] == 2:
+                pairs.setdefault(cand[i], []).append(i)
+        for bits, owners in pairs.items():
+            if len(owners) != 2:
+                continue
+            for i in unit:
+                if i in cand and i not in owners and cand[i] & bits:
+                    removed[i] |= bits
+                    cand[i] &= ~bits
+                    progress = True
+    return progress
+
+
+def random_solution(rng: random.Random = random) -> List[int]:
+    """
+    A random solved grid: the three independent diagonal boxes are shuffled,
+    the rest is completed by the solver and the digits are relabeled
+    """
+    seed = [0] * 81
+    for box in (0, 4, 8):
+        digits = rng.sample(range(1, 10), 9)
+        for i, cell in enumerate(_BOX_UNITS[box]):
+            seed[cell] = digits[i]
+    solution = solve_flat(seed)
+    relabel = [0] + rng.sample(range(1, 10), 9)
+    return [relabel[num] for num in solution]
+
+
+def _carve(
+        solution: List[int], target: Optional[int], symmetric: bool, rng: random.Random
+) -> List[int]:
+    """
+    Blank cells one by one (in pairs if symmetric), keeping a removal only if
+    the puzzle stays unique and, when a target is given, no harder than it
+    """
+    puzzle = solution[:]
+    cells = list(range(41 if symmetric else 81))
+    rng.shuffle(cells)
+    for cell in cells:
+        group = {cell, 80 - cell} if symmetric else {cell}
+        backup = [(i, puzzle[i]) for i in group]
+        for i in group:
+            puzzle[i] = 0
+        if dlx.count_solutions(puzzle) != 1 or (
+                target is not None and target < EXPERT and rate(puzzle) > target
+        ):
+            for i, num in backup:
+                puzzle[i] = num
+    return puzzle
+
+
+def generate(
+        difficulty: Optional[str] = None,
+        symmetric: bool = True,
+        max_attempts: int = 20,
+        rng: random.Random = None,
+) -> Generated:
+    """
+    Generate a puzzle with exactly one solution
+    :param difficulty: one of DIFFICULTIES, any difficulty if None
+    :param symmetric: blank cells in pairs symmetric about the center
+    :param max_attempts: grids to try before settling for the closest difficulty
+    :param rng: random generator, for reproducible puzzles
+    :return: Generated with flat puzzle, flat solution and difficulty index
+    """
+    rng = rng or random.Random()
+    target = None if difficulty is None else DIFFICULTIES.index(difficulty)
+    best = None
+    for _ in range(max_attempts):
+        solution = random_solution(rng)
+        puzzle = _carve(solution, target, symmetric, rng)
+        level = rate(puzzle)
+        if target is None or level == target:
+            return Generated(puzzle, solution, level)
+        if best is None or abs(level - target) < abs(best.difficulty - target):
+            best = Generated(puzzle, solution, level)
+    return best
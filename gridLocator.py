@@ -0,0 +1,210 @@
+"""
+Find the sudoku grid in a photographed board that may be skewed, rotated (up to
+about 30 degrees) or seen in perspective, so that it can be warped to an upright
+square with a single resample (see operateImage.warp_board).
+
+The grid is the largest connected blob of ink. Its corners are first taken from
+the extremes of that blob on a downsampled mask, then every side is refined by
+fitting a line to the outer edge of the border at full resolution.
+"""
+from typing import Optional
+
+import numpy as np
+from numpy import ndarray
+from PIL import Image
+
+# Longest side of the mask the connected components are labelled on
+COARSE_SIZE = 256
+# Points sampled along every side of the border to fit its line
+SIDE_SAMPLES = 48
+
+
+def component_labels(mask: ndarray) -> ndarray:
+    """
+    4-connected components of a 2d bool mask
+    :return: int array, for ink pixels the smallest flat index of their component,
+             mask.size for background pixels
+    """
+    height, width = mask.shape
+    background = mask.size
+    labels = np.where(mask, np.arange(mask.size).reshape(height, width), background)
+    while True:
+        # Hook every pixel to its smallest neighbouring label...
+        hooked = labels.copy()
+        np.minimum(hooked[1:], labels[:-1], out=hooked[1:])
+        np.minimum(hooked[:-1], labels[1:], out=hooked[:-1])
+        np.minimum(hooked[:, 1:], labels[:, :-1], out=hooked[:, 1:])
+        np.minimum(hooked[:, :-1], labels[:, 1:], out=hooked[:, :-1])
+        hooked[~mask] = background
+        # ...then jump to the label of that label, which roughly halves the
+        # number of rounds needed to cross a component
+        flat = np.append(hooked.ravel(), background)
+        hooked = flat[hooked]
+        if np.array_equal(hooked, labels):
+            return labels
+        labels = hooked
+
+
+def coarse_corners(mask: ndarray) -> Optional[ndarray]:
+    """
+    Corners of the largest blob of ink, from a max-pooled copy of the mask
+    :return: (4, 2) float array of (x, y), clockwise from the top left, None without ink
+    """
+    factor = max(1, -(-max(mask.shape) // COARSE_SIZE))
+    height, width = mask.shape[0] // factor, mask.shape[1] // factor
+    small = mask[:height * factor, :width * factor].reshape(height, factor, width, factor)
+    small = small.any(axis=(1, 3))
+    if not small.any():
+        return None
+
+    labels = component_labels(small)
+    ink = labels[small]
+    largest = np.bincount(ink).argmax()
+    ys, xs = np.nonzero(labels == largest)
+    total, diff = xs + ys, xs - ys
+    corners = np.array([
+        (xs[total.argmin()], ys[total.argmin()]),
+        (xs[diff.argmax()], ys[diff.argmax()]),
+        (xs[total.argmax()], ys[total.argmax()]),
+        (xs[diff.argmin()], ys[diff.argmin()]),
+    ], dtype=np.float64)
+    return (corners + 0.5) * factor
+
+
+def _edge_points(mask: ndarray, start: ndarray, stop: ndarray, vertical: bool, outward: int,
+                 reach: int):
+    """
+    Outer edge of the border across the side running from start to stop, sampled
+    along it. From the coarse line, the nearest ink is followed outwards to the end
+    of its run, so ink outside the grid (labels, buttons) is not taken for the border.
+    :param vertical: True for the left and right sides
+    :param outward: -1 if the outside is towards the top or left, 1 otherwise
+    :param reach: pixels searched on both sides of the coarse line
+    :return: positions along the side and the matching edge positions across it
+    """
+    along_axis, across_axis = (1, 0) if vertical else (0, 1)
+    t = np.linspace(0.1, 0.9, SIDE_SAMPLES)
+    along = np.rint(start[along_axis] + t * (stop[along_axis] - start[along_axis])).astype(int)
+    across = start[across_axis] + t * (stop[across_axis] - start[across_axis])
+    # Every window runs from the inside to the outside of the grid
+    offsets = outward * np.arange(-reach, reach + 1)
+    window = np.rint(across)[:, np.newaxis].astype(int) + offsets
+
+    limit = mask.shape[1] if vertical else mask.shape[0]
+    inside = (window >= 0) & (window < limit)
+    window = np.clip(window, 0, limit - 1)
+    fixed = np.broadcast_to(along[:, np.newaxis], window.shape)
+    hits = (mask[fixed, window] if vertical else mask[window, fixed]) & inside
+
+    found = hits.any(axis=1)
+    nearest = np.where(hits, np.abs(offsets), 2 * reach + 1).argmin(axis=1)
+    # First background pixel outside the nearest ink, or the end of the window
+    columns = np.arange(len(offsets))
+    gap = ~hits & (columns >= nearest[:, np.newaxis])
+    last = np.where(gap.any(axis=1), gap.argmax(axis=1), len(offsets)) - 1
+    edge = window[np.arange(len(window)), last]
+    # Pixels are unit squares: the bottom and right edges are one pixel further out
+    return along[found], edge[found] + (outward > 0)
+
+
+def _fit_line(along: ndarray, across: ndarray, start: ndarray, stop: ndarray, vertical: bool):
+    """
+    across = slope * along + intercept, least squares after dropping outliers, or
+    the line through the coarse corners when too few points were found
+    """
+    if len(along) >= 5:
+        slope, intercept = np.polyfit(along, across, 1)
+        residual = np.abs(across - (slope * along + intercept))
+        keep = residual <= max(1.5, 2.5 * np.median(residual))
+        if keep.sum() >= 5:
+            return np.polyfit(along[keep], across[keep], 1)
+    along_axis, across_axis = (1, 0) if vertical else (0, 1)
+    slope = (stop[across_axis] - start[across_axis]) / max(
+        stop[along_axis] - start[along_axis], 1e-9
+    )
+    return slope, start[across_axis] - slope * start[along_axis]
+
+
+def find_corners(mask: ndarray) -> Optional[ndarray]:
+    """
+    Outer corners of the grid border
+    :param mask: binarized board picture, see operateImage.binarize
+    :return: (4, 2) float array of (x, y), clockwise from the top left, None without ink
+    """
+    mask = mask.astype(bool)
+    coarse = coarse_corners(mask)
+    if coarse is None:
+        return None
+    reach = 2 * max(1, -(-max(mask.shape) // COARSE_SIZE)) + 2
+    top_left, top_right, bottom_right, bottom_left = coarse
+    sides = [
+        (top_left, top_right, False, -1),
+        (top_right, bottom_right, True, 1),
+        (bottom_left, bottom_right, False, 1),
+        (top_left, bottom_left, True, -1),
+    ]
+    top, right, bottom, left = (
+        _fit_line(*_edge_points(mask, start, stop, vertical, outward, reach), start, stop, vertical)
+        for start, stop, vertical, outward in sides
+    )
+
+    def cross(horizontal, vertical):
+        # y = a * x + b meets x = c * y + d
+        (a, b), (c, d) = horizontal, vertical
+        x = (c * b + d) / (1 - a * c)
+        return x, a * x + b
+
+    return np.array(
+        [cross(top, left), cross(top, right), cross(bottom, right), cross(bottom, left)]
+    )
+
+
+def perspective_coefficients(corners: ndarray, side: int) -> tuple:
+    """
+    Coefficients for Image.transform(..., Image.PERSPECTIVE) taking the square
+    (0, 0)-(side, side) of the output to the quadrilateral corners of the input
+    """
+    square = np.array([(0, 0), (side, 0), (side, side), (0, side)], dtype=np.float64)
+    equations = np.zeros((8, 8))
+    targets = np.zeros(8)
+    for k, ((u, v), (x, y)) in enumerate(zip(square, corners)):
+        equations[2 * k] = (u, v, 1, 0, 0, 0, -u * x, -v * x)
+        equations[2 * k + 1] = (0, 0, 0, u, v, 1, -u * y, -v * y)
+        targets[2 * k], targets[2 * k + 1] = x, y
+    return tuple(np.linalg.solve(equations, targets))
+
+
+def warp(img: Image.Image, corners: ndarray, side: int = None) -> Image.Image:
+    """
+    Resample the quadrilateral of img onto an upright square
+    :param side: side of the square, defaults to the mean side of the quadrilateral
+                 rounded to a multiple of 9
+    """
+    if side is None:
+        lengths = np.linalg.norm(corners - np.roll(corners, -1, axis=0), axis=1)
+        side = 9 * max(1, int(round(lengths.mean() / 9)))
+    coefficients = perspective_coefficients(corners, side)
+    return img.transform((side, side), Image.PERSPECTIVE, coefficients, Image.NEAREST)
+
+
+def grid_lines(mask: ndarray, axis: int = 0, search: float = 1 / 4) -> ndarray:
+    """
+    Positions of the 10 grid lines of an upright square board, from the ink profile
+    :param mask: binarized square board, e.g. the result of warp
+    :param axis: 0 for horizontal lines (rows), 1 for vertical lines (columns)
+    :param search: part of a cell searched on both sides of the expected line
+    :return: float array of 10 positions, NaN where no line covers half the board
+    """
+    profile = mask.mean(axis=1 - axis)
+    length = len(profile)
+    cell = length / 9
+    out = np.full(10, np.nan)
+    for k in range(10):
+        low = max(0, int(k * cell - search * cell))
+        high = min(length, int(k * cell + search * cell) + 1)
+        if low >= high:
+            continue
+        peak = low + int(profile[low:high].argmax())
+        if profile[peak] >= 0.5:
+            out[k] = peak
+    return out
@@ -0,0 +1,169 @@
+"""
+Timings and counters of the pipeline stages. Disabled by default, in which case
+stage() hands back a shared no-op context and count() returns at once.
+
+    import instrument
+    recorder = instrument.enable()
+    ...
+    print(recorder.prometheus())
+"""
+import json
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+
+class StageStats:
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+
+class Recorder:
+    """
+    Collects per-stage timings and named counters, and forwards every event to
+    listeners, e.g. log_events
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, StageStats] = {}
+        self.counters: Dict[str, int] = {}
+        self.listeners: List[Callable[[dict], None]] = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener: Callable[[dict], None]) -> None:
+        self.listeners.append(listener)
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            stats = self.stages.get(name)
+            if stats is None:
+                stats = self.stages[name] = StageStats()
+            stats.add(seconds)
+        for listener in self.listeners:
+            listener({"type": "stage", "stage": name, "seconds": seconds})
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+        for listener in self.listeners:
+            listener({"type": "counter", "name": name, "n": n})
+
+    def snapshot(self) -> dict:
+        """
+        Aggregated numbers as plain data, ready for json.dumps
+        """
+        with self._lock:
+            return {
+                "stages": {
+                    name: {"count": s.count, "total": s.total, "max": s.max}
+                    for name, s in self.stages.items()
+                },
+                "counters": dict(self.counters),
+            }
+
+    def prometheus(self, prefix: str = "sudoku") -> str:
+        """
+        Snapshot in the Prometheus text exposition format
+        """
+        snapshot = self.snapshot()
+        lines = [
+            f"# TYPE {prefix}_stage_seconds summary",
+        ]
+        for name, s in sorted(snapshot["stages"].items()):
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {s["count"]}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {s["total"]:.6f}')
+        lines.append(f"# TYPE {prefix}_stage_seconds_max gauge")
+        for name, s in sorted(snapshot["stages"].items()):
+            lines.append(f'{prefix}_stage_seconds_max{{stage="{name}"}} {s["max"]:.6f}')
+        lines.append(f"# TYPE {prefix}_events_total counter")
+        for name, n in sorted(snapshot["counters"].items()):
+            lines.append(f'{prefix}_events_total{{name="{name}"}} {n}')
+        return "\n".join(lines) + "\n"
+
+
+class _Timer:
+    __slots__ = ("recorder", "name", "start")
+
+    def __init__(self, recorder: Recorder, name: str):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.recorder.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+_recorder: Optional[Recorder] = None
+
+
+def enable(recorder: Recorder = None) -> Recorder:
+    """
+    Start recording into recorder (a new one by default) and return it
+    """
+    global _recorder
+    _recorder = recorder or Recorder()
+    return _recorder
+
+
+def disable() -> None:
+    global _recorder
+    _recorder = None
+
+
+def current() -> Optional[Recorder]:
+    return _recorder
+
+
+def stage(name: str):
+    """
+    Context manager timing a stage: with instrument.stage("binarize"): ...
+    """
+    if _recorder is None:
+        return _NULL_TIMER
+    return _Timer(_recorder, name)
+
+
+def count(name: str, n: int = 1) -> None:
+    """
+    Increase a named counter, e.g. cells skipped by recognition
+    """
+    if _recorder is not None:
+        _recorder.count(name, n)
+
+
+def log_events(logger: logging.Logger = None, level: int = logging.INFO) -> Callable[[dict], None]:
+    """
+    Listener writing every event as one JSON log line
+    """
+    logger = logger or logging.getLogger("sudoku.instrument")
+
+    def listener(event: dict) -> None:
+        logger.log(level, json.dumps(event))
+
+    return listener
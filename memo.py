@@ -0,0 +1,112 @@
+"""
+In-memory memos that import nothing heavier than the solver, so that the first
+solve of the app does not load PIL or numpy.
+"""
+from collections import OrderedDict
+from typing import List, Optional
+
+from solver import Puzzle, SearchLimit, parse_puzzle, solve_flat
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Bounded in-memory mapping that drops the least recently used entry when full
+    """
+
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        value = self._data.get(key, _MISSING)
+        if value is _MISSING:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+class SolveCache:
+    """
+    Solutions keyed by the exact puzzle and, for puzzles that are expensive to
+    solve, by the canonical form of the puzzle, so that one only differing from a
+    solved one by relabeling, swapping rows, columns, bands or stacks, or
+    transposing is answered without solving. Canonicalizing costs about as much
+    as a few dozen search nodes (far more on nearly empty or full grids), so
+    cheap puzzles are solved directly.
+    """
+
+    def __init__(
+            self,
+            max_size: int = 4096,
+            max_nodes: int = 32,
+            min_givens: int = 17,
+            max_givens: int = 40,
+    ):
+        """
+        :param max_size: number of solutions kept
+        :param max_nodes: search nodes tried before the canonical form is looked up
+        :param min_givens: puzzles with fewer givens are never canonicalized
+        :param max_givens: puzzles with more givens are never canonicalized
+        """
+        self.memory = LRUCache(max_size)
+        self.max_nodes = max_nodes
+        self.min_givens = min_givens
+        self.max_givens = max_givens
+
+    def solve(self, puzzle: Puzzle) -> Optional[List[int]]:
+        """
+        :return: solution as a flat list of 81 digits, None if there is none
+        """
+        flat = parse_puzzle(puzzle)
+        # A canonical puzzle is its own exact key, so both kinds of entry share
+        # one mapping: 81 digits -> solution, False if there is none
+        key = bytes(flat)
+        solution = self.memory.get(key)
+        if solution is None:
+            solution = self._solve(flat)
+            self.memory.put(key, solution)
+        return solution or None
+
+    def _solve(self, flat: List[int]):
+        try:
+            return solve_flat(flat, self.max_nodes) or False
+        except SearchLimit:
+            pass
+        givens = sum(1 for num in flat if num)
+        if not self.min_givens <= givens <= self.max_givens:
+            return solve_flat(flat) or False
+        # numpy is only imported once a puzzle is worth canonicalizing
+        from canonical import canonicalize
+
+        canonical, transform = canonicalize(flat)
+        key = bytes(canonical)
+        solution = self.memory.get(key)
+        if solution is None:
+            solution = solve_flat(canonical) or False
+            self.memory.put(key, solution)
+        return solution and transform.invert(solution)
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.memory.hits,
+            "misses": self.memory.misses,
+            "size": len(self.memory),
+        }
@@ -0,0 +1,96 @@
+"""
+Binary training model: a 32 byte header, an (n, d) float32 feature matrix and
+n uint8 labels. The arrays are stored raw so they can be memory mapped.
+
+Convert a model pickled by older versions of train.py:
+
+    python model.py train.module train.module
+"""
+import argparse
+import os
+import pickle
+import struct
+from typing import Tuple
+
+import numpy as np
+from numpy import ndarray
+
+MAGIC = b"SDKM"
+VERSION = 1
+HEADER_SIZE = 32
+# magic, version, header size, number of samples, number of features
+_HEADER = struct.Struct("<4sHHII")
+
+
+def is_binary_model(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def save_model(path: str, features: ndarray, labels: ndarray) -> None:
+    """
+    Write a model, replacing the file atomically
+    :param features: (n, d) feature vectors
+    :param labels: (n,) digits
+    """
+    features = np.ascontiguousarray(features, dtype="<f4")
+    labels = np.ascontiguousarray(labels, dtype=np.uint8)
+    assert features.ndim == 2 and len(features) == len(labels)
+    header = _HEADER.pack(MAGIC, VERSION, HEADER_SIZE, *features.shape)
+    temp = path + ".tmp"
+    with open(temp, "wb") as f:
+        f.write(header.ljust(HEADER_SIZE, b"\0"))
+        f.write(features.tobytes())
+        f.write(labels.tobytes())
+    os.replace(temp, path)
+
+
+def load_model(path: str, mmap: bool = True) -> Tuple[ndarray, ndarray]:
+    """
+    Read a model written by save_model
+    :param mmap: map the file instead of reading it, no copy is made
+    :return: features and labels
+    """
+    with open(path, "rb") as f:
+        magic, version, header_size, samples, dims = _HEADER.unpack(
+            f.read(_HEADER.size)
+        )
+    if magic != MAGIC:
+        raise ValueError("Not a binary model: " + path)
+    if version != VERSION:
+        raise ValueError(f"Unsupported model version {version}: {path}")
+    label_offset = header_size + samples * dims * 4
+    if mmap:
+        features = np.memmap(
+            path, dtype="<f4", mode="r", offset=header_size, shape=(samples, dims)
+        )
+        labels = np.memmap(path, dtype=np.uint8, mode="r", offset=label_offset, shape=(samples,))
+        return features, labels
+    with open(path, "rb") as f:
+        data = f.read()
+    features = np.frombuffer(data, "<f4", samples * dims, header_size).reshape(samples, dims)
+    labels = np.frombuffer(data, np.uint8, samples, label_offset)
+    return features, labels
+
+
+def convert_pickle(source: str, destination: str) -> None:
+    """
+    Turn a {digit: [feature, ...]} pickle into a binary model
+    """
+    with open(source, "rb") as f:
+        train_set = pickle.load(f)
+    features = [vec for num in train_set for vec in train_set[num]]
+    labels = [num for num in train_set for _ in train_set[num]]
+    save_model(destination, np.array(features), np.array(labels))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert a pickled model to the binary format")
+    parser.add_argument("source", help="pickled model")
+    parser.add_argument("destination", help="binary model, can be the same file")
+    args = parser.parse_args(argv)
+    convert_pickle(args.source, args.destination)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,124 +1,243 @@
-from typing import Union
+from collections import namedtuple
+from typing import Optional, Union
 
 import numpy as np
 from PIL import Image
 from numpy.core.multiarray import ndarray
 
 import constants
+import gridLocator
+import instrument
+from classifier import KNNClassifier, load_classifier
+from detectBorder import BorderRuns, longest_run, run_bounds, scan_border
 
 
-def get_image_feature(img: Image.Image):
-    img = img.convert("L")
-    array: ndarray = np.array(img)
-    for i in range(array.shape[0]):
-        for j in range(array.shape[1]):
-            if array[i, j] < constants.BLACK_SENSITIVE:  # Sensible, can be changed
-                array[i, j] = 1
-            else:
-                array[i, j] = 0
+BINARIZE_MODES = ("fixed", "otsu", "adaptive")
+
+
+def binarize(
+        img: Union[Image.Image, ndarray],
+        mode: str = None,
+        threshold: int = None,
+        block_size: int = None,
+        offset: int = None,
+) -> ndarray:
+    """
+    Turn an image into a mask where 1 means black (ink) and 0 means background
+    :param img: PIL image or 2d grayscale array
+    :param mode: one of BINARIZE_MODES, defaults to constants.BINARIZE_MODE
+    :param threshold: gray level for "fixed" mode, defaults to constants.BLACK_SENSITIVE
+    :param block_size: window side for "adaptive" mode
+    :param offset: how much darker than the local mean a pixel must be in "adaptive" mode
+    :return: uint8 array of 0 and 1 with the same shape as the image
+    """
+    with instrument.stage("binarize"):
+        if isinstance(img, Image.Image):
+            img = img.convert("L")
+        gray: ndarray = np.asarray(img)
+        mode = mode or constants.BINARIZE_MODE
+
+        if mode == "fixed":
+            if threshold is None:
+                threshold = constants.BLACK_SENSITIVE
+            return (gray < threshold).view(np.uint8)
+        if mode == "otsu":
+            return (gray < otsu_threshold(gray)).view(np.uint8)
+        if mode == "adaptive":
+            if block_size is None:
+                block_size = constants.ADAPTIVE_BLOCK_SIZE
+            if offset is None:
+                offset = constants.ADAPTIVE_OFFSET
+            return (gray < local_mean(gray, block_size) - offset).view(np.uint8)
+        raise ValueError("Unknown binarize mode: " + str(mode))
+
+
+def otsu_threshold(gray: ndarray) -> int:
+    """
+    Threshold maximizing the between-class variance of the gray level histogram.
+    Pixels strictly below the returned value belong to the dark class.
+    """
+    hist = np.bincount(gray.ravel(), minlength=256)[:256].astype(np.float64)
+    levels = np.arange(256, dtype=np.float64)
+    # weight_dark[t] / sum_dark[t] describe pixels with value < t
+    weight_dark = np.concatenate(([0.0], np.cumsum(hist)[:-1]))
+    sum_dark = np.concatenate(([0.0], np.cumsum(hist * levels)[:-1]))
+    weight_light = hist.sum() - weight_dark
+    sum_light = (hist * levels).sum() - sum_dark
+    with np.errstate(divide="ignore", invalid="ignore"):
+        between = weight_dark * weight_light * (
+                sum_dark / weight_dark - sum_light / weight_light
+        ) ** 2
+    between[~np.isfinite(between)] = 0
+    return int(between.argmax())
+
+
+def local_mean(gray: ndarray, block_size: int) -> ndarray:
+    """
+    Mean of the block_size * block_size window around every pixel, edges replicated
+    """
+    half = block_size // 2
+    padded = np.pad(gray.astype(np.float64), half + 1, mode="edge")
+    integral = padded.cumsum(axis=0).cumsum(axis=1)
+    h, w = gray.shape
+    size = 2 * half + 1
+    total = (
+            integral[size:size + h, size:size + w]
+            - integral[:h, size:size + w]
+            - integral[size:size + h, :w]
+            + integral[:h, :w]
+    )
+    return total / (size * size)
+
+
+def feature_settings() -> dict:
+    """
+    Settings get_image_feature depends on: features, and boards recognized from
+    them, made under other settings must not be reused
+    """
+    return {
+        "BLACK_SENSITIVE": constants.BLACK_SENSITIVE,
+        "BINARIZE_MODE": constants.BINARIZE_MODE,
+        "ADAPTIVE_BLOCK_SIZE": constants.ADAPTIVE_BLOCK_SIZE,
+        "ADAPTIVE_OFFSET": constants.ADAPTIVE_OFFSET,
+        "FEATURE_GRID": constants.FEATURE_GRID,
+    }
+
+
+def get_image_feature(img: Union[Image.Image, ndarray]):
+    """
+    Feature of one cell picture, or of a grayscale cell view from split_board
+    """
+    return cell_feature(binarize(img))
+
+
+def cell_feature(array: ndarray):
+    """
+    Feature of one binarized cell, False if no digit is found in it, None if the
+    cell cannot be read (see resize_image_array)
+    """
     result = resize_image_array(array)
-    if result is not False:
-        return calculate_feature(result)
-    return False
+    if result is None:
+        instrument.count("cells_failed")
+        return None
+    if result is False:
+        instrument.count("cells_skipped")
+        return False
+    return calculate_feature(result)
 
 
 def resize_image_array(
         array: ndarray, board_cut_tolerance: float = 0.15
-) -> Union[ndarray, bool]:
-    cut_up = cut_left = 0
-    cut_down, cut_right = array.shape
-    cut_right -= 1
-    cut_down -= 1
-
-    for i in range(int(array.shape[0] * board_cut_tolerance), -1, -1):
-        if boarder_exist(array[i, :], reverse=True, min_boarder_length=0.8):
-            cut_up = i
-            break
-    for i in range(int(array.shape[1] * board_cut_tolerance), -1, -1):
-        if boarder_exist(array[:, i], reverse=True, min_boarder_length=0.8):
-            cut_left = i
-            break
-    for i in range(
-            array.shape[0] - 1, int(array.shape[0] * (1 - board_cut_tolerance) - 1), -1
-    ):
-        if boarder_exist(array[i, :], reverse=True, min_boarder_length=0.8):
-            cut_down = i
-            break
-    for i in range(
-            array.shape[1] - 1, int(array.shape[1] * (1 - board_cut_tolerance) - 1), -1
-    ):
-        if boarder_exist(array[:, i], reverse=True, min_boarder_length=0.8):
-            cut_right = i
-            break
+) -> Union[ndarray, bool, None]:
+    """
+    Cut the grid lines off a binarized cell and bound the digit inside it
+    :return: view of the digit, False if the cell is empty, None if it cannot be read
+             (ink running into the top or left edge once the grid lines are cut)
+    """
+    height, width = array.shape
+    runs = BorderRuns(array, filled=0)
+    rows, columns = runs.row_borders(0.8), runs.column_borders(0.8)
 
-    array = np.delete(array, slice(cut_down, array.shape[0]), axis=0)
-    array = np.delete(array, slice(cut_right, array.shape[1]), axis=1)
-    array = np.delete(array, slice(0, cut_up), axis=0)
-    array = np.delete(array, slice(0, cut_left), axis=1)
-
-    ver_slice = []
-    temp = []
-    for i in range(array.shape[1] - 1):
-        if all(array[:, i] == 0) and any(array[:, i + 1] == 1):
-            if not temp:
-                temp.append(i)
-            else:
-                raise RuntimeError()
-        elif any(array[:, i] == 1) and all(array[:, i + 1] == 0):
-            if len(temp) == 1:
-                temp.append(i)
-                ver_slice.append(temp)
-                temp = []
-            else:
-                raise RuntimeError
-    if not ver_slice:
-        return False
-    ver_max = max(ver_slice, key=lambda lst: lst[1] - lst[0])
-    array = np.delete(array, slice(ver_max[1] + 1, array.shape[1]), axis=1)
-    array = np.delete(array, slice(0, ver_max[0] + 1), axis=1)
-
-    # Horizontal
-    hor_slice = []
-    temp = []
-    for i in range(array.shape[0] - 1):
-        if all(array[i, :] == 0) and any(array[i + 1, :] == 1):
-            if not temp:
-                temp.append(i)
-            else:
-                raise RuntimeError()
-        elif any(array[i, :] == 1) and all(array[i + 1, :] == 0):
-            if len(temp) == 1:
-                temp.append(i)
-                hor_slice.append(temp)
-                temp = []
-            else:
-                raise RuntimeError
-    if not hor_slice:
+    cut_up = scan_border(rows, int(height * board_cut_tolerance), -1, default=0)
+    cut_left = scan_border(columns, int(width * board_cut_tolerance), -1, default=0)
+    cut_down = scan_border(
+        rows, height - 1, int(height * (1 - board_cut_tolerance) - 1), default=height - 1
+    )
+    cut_right = scan_border(
+        columns, width - 1, int(width * (1 - board_cut_tolerance) - 1), default=width - 1
+    )
+    array = array[cut_up:cut_down, cut_left:cut_right]
+
+    columns = _digit_span(array.any(axis=0))
+    if not isinstance(columns, slice):
+        return columns
+    array = array[:, columns]
+    rows = _digit_span(array.any(axis=1))
+    if not isinstance(rows, slice):
+        return rows
+    return array[rows]
+
+
+def _digit_span(occupied: ndarray) -> Union[slice, bool, None]:
+    """
+    Widest run of inked lines lying strictly inside an occupancy profile
+    :return: slice of the run, False if there is none, None if a run starts at the
+             first line and ends before the last one
+    """
+    starts, stops = run_bounds(occupied)
+    if len(starts) and starts[0] == 0 and stops[0] < len(occupied):
+        return None
+    inner = (starts > 0) & (stops < len(occupied))
+    if not inner.any():
         return False
-    hor_max = max(hor_slice, key=lambda lst: lst[1] - lst[0])
-    array = np.delete(array, slice(hor_max[1] + 1, array.shape[0]), axis=0)
-    array = np.delete(array, slice(0, hor_max[0] + 1), axis=0)
-
-    return array
-
-
-def calculate_feature(array: ndarray):
-    # assert array.shape[0] > 10 and array.shape[1] > 10
-    out = []
-    unit_width, unit_height = array.shape[1] // 10, array.shape[0] // 10
-    for row in range(10):
-        for column in range(10):
-            out.append(
-                array[
-                    row * unit_height: (row + 1) * unit_height + 1,
-                    column * unit_width: (column + 1) * unit_width + 1,
-                ].mean()
-            )
-    out.append(array.mean())
+    widest = np.where(inner, stops - starts, -1).argmax()
+    return slice(starts[widest], stops[widest])
+
+
+def calculate_feature(array: ndarray, grid: int = None):
+    """
+    Mean of every zone of a grid * grid partition of the cell (neighbouring zones
+    share one line of pixels), followed by the mean of the whole cell
+    :param grid: zones per side, defaults to constants.FEATURE_GRID; models are only
+                 valid for the grid they were trained with
+    :return: list of grid * grid + 1 floats
+    """
+    return calculate_features(array[np.newaxis], grid)[0].tolist()
+
+
+def calculate_features(cells: ndarray, grid: int = None) -> ndarray:
+    """
+    calculate_feature of a stack of equally sized cells, from summed-area tables.
+    Integer and bool (e.g. binarized) cells are summed exactly in int64, so the
+    result is that of taking the mean of each zone separately; other cells are
+    summed in float64.
+    :param cells: (n, height, width) array
+    :return: (n, grid * grid + 1) float64 array
+    """
+    grid = grid or constants.FEATURE_GRID
+    count, height, width = cells.shape
+    dtype = np.int64 if cells.dtype.kind in "biu" else np.float64
+    integral = np.zeros((count, height + 1, width + 1), dtype=dtype)
+    integral[:, 1:, 1:] = cells.cumsum(axis=1, dtype=dtype).cumsum(axis=2)
+
+    top, bottom = _zone_bounds(height, grid)
+    left, right = _zone_bounds(width, grid)
+    top, bottom = top[:, np.newaxis], bottom[:, np.newaxis]
+    sums = (
+            integral[:, bottom, right]
+            - integral[:, top, right]
+            - integral[:, bottom, left]
+            + integral[:, top, left]
+    )
+    out = np.empty((count, grid * grid + 1))
+    out[:, :-1] = (sums / ((bottom - top) * (right - left))).reshape(count, -1)
+    out[:, -1] = integral[:, height, width] / (height * width)
     return out
 
 
-def split_board(img: Image.Image):
+def _zone_bounds(length: int, grid: int):
+    """
+    Start and stop of the grid zones along one axis, each one unit long plus the
+    first line of the next zone, clipped to the cell
+    """
+    unit = length // grid
+    start = np.arange(grid) * unit
+    return start, np.minimum(start + unit + 1, length)
+
+
+def split_board(img: Image.Image, as_array: bool = False):
+    """
+    Cut a cropped board into its 81 cells, row by row
+    :param as_array: convert the board to grayscale once and return the cells as a
+                     (9, 9, cell_height, cell_width) view of that single array,
+                     indexed by [row, column], instead of yielding 81 PIL crops
+    """
+    if as_array:
+        return cell_views(np.asarray(img.convert("L")))
+    return _crop_cells(img)
+
+
+def _crop_cells(img: Image.Image):
     x, y = img.size
     tx, ty = x // 9, y // 9
     for q in range(9):
@@ -128,74 +247,112 @@ def split_board(img: Image.Image):
             # result.save(r"test\_{}{}.jpg".format(p, q))
 
 
+def cell_views(array: ndarray) -> ndarray:
+    """
+    Split a board array into its 81 cells without copying
+    :param array: 2d array of the cropped board, grayscale or binarized
+    :return: (9, 9, cell_height, cell_width) view, indexed by [row, column]
+    """
+    height, width = array.shape
+    ty, tx = height // 9, width // 9
+    return array[:ty * 9, :tx * 9].reshape(9, ty, 9, tx).swapaxes(1, 2)
+
+
+RecognizedBoard = namedtuple(
+    "RecognizedBoard", ["board", "confidence", "fail", "candidates", "shares"]
+)
+
+
+def recognize_board(board: Image.Image, classifier: KNNClassifier = None, locator: str = None):
+    """
+    Read all 81 digits of a board picture, classifying every cell in one batch
+    :param board: picture of the board
+    :param classifier: defaults to the model in train.module
+    :param locator: see locate_board
+    :return: RecognizedBoard with
+             board: 9 * 9 array of digits, 0 for empty cells;
+             confidence: 9 * 9 array, share of the k neighbours voting for the digit
+                         (1 for empty cells, 0 for failed cells);
+             fail: list of (row, column) of cells that could not be read;
+             candidates: 9 * 9 * 3 array, the three digits with the most votes
+                         (board is candidates[..., 0], all 0 for empty and failed cells);
+             shares: 9 * 9 * 3 array, share of the votes of every candidate
+                     (confidence is shares[..., 0])
+    """
+    if classifier is None:
+        classifier = load_classifier()
+    with instrument.stage("crop"):
+        board = locate_board(board, locator)
+    mask = binarize(board)
+    with instrument.stage("split"):
+        cells = cell_views(mask)
+
+    features = np.zeros((81, constants.FEATURE_GRID ** 2 + 1))
+    found = np.zeros(81, dtype=bool)
+    fail = []
+    with instrument.stage("feature"):
+        for index in range(81):
+            feature = cell_feature(cells[divmod(index, 9)])
+            if feature is None:
+                fail.append(divmod(index, 9))
+            elif feature is not False:
+                features[index] = feature
+                found[index] = True
+
+    candidates = np.zeros((81, 3), dtype=np.intp)
+    shares = np.zeros((81, 3))
+    shares[:, 0] = 1
+    if found.any():
+        with instrument.stage("classify"):
+            candidates[found], shares[found] = classifier.top(features[found], 3)
+    for row, column in fail:
+        shares[row * 9 + column, 0] = 0
+    candidates, shares = candidates.reshape(9, 9, 3), shares.reshape(9, 9, 3)
+    return RecognizedBoard(candidates[..., 0], shares[..., 0], fail, candidates, shares)
+
+
 def boarder_exist(
         array: ndarray, reverse: bool = False, min_boarder_length: float = 0.6
 ):
-    blacks = 0
-    temp_black = 0
     empty, filled = 0, 1
     if reverse:
         empty, filled = filled, empty
-    for i in array:
-        if i == empty:
-            if temp_black > 0:
-                blacks = max(blacks, temp_black)
-                temp_black = 0
-            else:
-                temp_black = 0
-                continue
-        elif i == filled:
-            temp_black += 1
-        else:
-            raise ValueError("Unexpected object type: " + i)
-    blacks = max(blacks, temp_black)
-    return blacks >= (len(array) * min_boarder_length)
+    array = np.asarray(array)
+    if not np.isin(array, (empty, filled)).all():
+        raise ValueError("Unexpected value in border array")
+    return longest_run(array, filled) >= (len(array) * min_boarder_length)
 
 
 def optimize_board(board: Image.Image, tolerance: float = 0.2):
     board = board.convert("L")
     # board.show()
-    cut_up = cut_left = 0
-    cut_right, cut_down = board.size
-    cut_down -= 1
-    cut_right -= 1
-    img = np.array(board)
-    for i in range(img.shape[0]):
-        for j in range(img.shape[1]):
-            if img[i, j] < constants.BLACK_SENSITIVE:  # Sensible, can be changed
-                img[i, j] = 1
-            else:
-                img[i, j] = 0
-
-    for i in range(int(img.shape[0] * tolerance), -1, -1):
-        if boarder_exist(img[i, :]):
-            cut_up = i
-            break
-    for i in range(int(img.shape[1] * tolerance), -1, -1):
-        if boarder_exist(img[:, i]):
-            cut_left = i
-            break
-    for i in range(img.shape[0] - 1, int(img.shape[0] * (1 - tolerance) - 1), -1):
-        if boarder_exist(img[i, :]):
-            cut_down = i
-            break
-    for i in range(img.shape[1] - 1, int(img.shape[1] * (1 - tolerance) - 1), -1):
-        if boarder_exist(img[:, i]):
-            cut_right = i
-            break
+    img = binarize(board)
+    height, width = img.shape
+    runs = BorderRuns(img)
+    rows, columns = runs.row_borders(0.6), runs.column_borders(0.6)
 
+    cut_up = scan_border(rows, int(height * tolerance), -1, default=0)
+    cut_left = scan_border(columns, int(width * tolerance), -1, default=0)
+    cut_down = scan_border(
+        rows, height - 1, int(height * (1 - tolerance) - 1), default=height - 1
+    )
+    cut_right = scan_border(
+        columns, width - 1, int(width * (1 - tolerance) - 1), default=width - 1
+    )
+
+    # Step over blank lines left between the border and the grid
     while 1:
         out = True
-        if all(img[cut_up, :] == 0):
+        if runs.rows[cut_up] == 0:
             cut_up += 1
             out = False
-        if all(img[cut_down, :] == 0):
+        if runs.rows[cut_down] == 0:
             cut_down -= 1
             out = False
-        if all(img[:, cut_left] == 0):
+        if runs.columns[cut_left] == 0:
             cut_left += 1
             out = False
-        if all(img[:, cut_right] == 0):
+        if runs.columns[cut_right] == 0:
             cut_right -= 1
             out = False
         if out:
@@ -205,21 +362,56 @@ def optimize_board(board: Image.Image, tolerance: float = 0.2):
     return board
 
 
+BOARD_LOCATORS = ("axis", "perspective")
+
+
+def locate_board(board: Image.Image, locator: str = None) -> Image.Image:
+    """
+    Grayscale picture of the grid alone, ready for split_board
+    :param locator: one of BOARD_LOCATORS, defaults to constants.BOARD_LOCATOR:
+                    "axis" crops straight screenshots (optimize_board),
+                    "perspective" straightens photos (warp_board) and falls back
+                    to "axis" when it finds no grid
+    """
+    locator = locator or constants.BOARD_LOCATOR
+    if locator == "perspective":
+        square = warp_board(board)
+        if square is not None:
+            return square
+        instrument.count("warp_fallbacks")
+    elif locator != "axis":
+        raise ValueError("Unknown board locator: " + str(locator))
+    return optimize_board(board)
+
+
+def warp_board(board: Image.Image) -> Optional[Image.Image]:
+    """
+    Find the grid of a skewed, rotated or perspective photo and resample it once
+    onto an upright square whose side is a multiple of 9, so that every cell of
+    split_board lies exactly on the grid
+    :return: grayscale square, None if no grid with its box lines is found
+    """
+    board = board.convert("L")
+    corners = gridLocator.find_corners(binarize(board))
+    if corners is None:
+        return None
+    square = gridLocator.warp(board, corners)
+    mask = binarize(square)
+    for axis in (0, 1):
+        # The lines between the boxes are the heaviest inner lines of any grid
+        if np.isnan(gridLocator.grid_lines(mask, axis)[[3, 6]]).any():
+            return None
+    return square
+
+
 def distance(v1: ndarray, v2: ndarray):
     return ((v1 - v2) ** 2).sum() ** 0.5
 
 
-def ocr(train_set: dict, featured_image: ndarray, k=10):
-    dists = [(0, 10000)]
-    for num in train_set:
-        for val in train_set[num]:
-            dists.append((num, distance(np.array(val), featured_image)))
-    dists = sorted(dists, key=lambda x: x[1])
-    min_dist = {x: 0 for x in range(1, 11)}
-
-    for dist in dists[:k]:
-        min_dist[dist[0]] += 1
-    return max(min_dist.keys(), key=lambda x: min_dist[x])
+def ocr(train_set: Union[dict, KNNClassifier], featured_image: ndarray, k=10):
+    if isinstance(train_set, dict):
+        train_set = KNNClassifier.from_train_set(train_set, k)
+    return int(train_set.predict(featured_image)[0])
 
 
 def main():
@@ -0,0 +1,261 @@
+"""
+Headless HTTP service, standard library only:
+
+    python service.py --port 8080 -j 4
+
+    POST /solve      body: 81-char puzzle ("0" or "." for empty cells)
+    POST /recognize  body: picture of a board
+    GET  /health
+    GET  /metrics    request and stage timings in the Prometheus text format
+
+Requests are parsed on an asyncio loop and the CPU-bound work runs in a process
+pool whose workers load the model once. The workers are all started before the
+server listens, so none of them inherits a client socket; they time the stages
+of every job and send the timings back with its result. Past max_inflight concurrent jobs new
+requests are refused with 503 so that a burst cannot pile up unbounded work.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+
+import constants
+import dlx
+import instrument
+import solver
+from generator import DIFFICULTIES, rate
+
+MAX_BODY = 16 * 1024 * 1024
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    411: "Length Required",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+_model_path = constants.MODEL_PATH
+
+
+def _init_worker(model_path: str):
+    global _model_path
+    from classifier import load_classifier
+
+    _model_path = model_path
+    load_classifier(model_path)
+
+
+def _run_task(fn, arg) -> tuple:
+    """
+    fn(arg) in a worker, with the stage timings and counters it recorded
+    :return: result, list of instrument events
+    """
+    events = []
+    instrument.enable().add_listener(events.append)
+    try:
+        return fn(arg), events
+    finally:
+        instrument.disable()
+
+
+def solve_task(puzzle: str) -> dict:
+    """
+    Solution, uniqueness and difficulty of an 81-char puzzle
+    """
+    flat = solver.parse_puzzle(puzzle)
+    count = dlx.count_solutions(flat)
+    solution = solver.solve_flat(flat) if count else None
+    return {
+        "puzzle": solver.format_puzzle(flat),
+        "solution": solver.format_puzzle(solution) if solution else None,
+        "solutions": count,
+        "unique": count == 1,
+        "difficulty": DIFFICULTIES[rate(flat)] if count == 1 else None,
+    }
+
+
+def recognize_task(data: bytes) -> dict:
+    """
+    Recognized grid of a board picture, plus what solve_task says about it
+    """
+    from PIL import Image
+
+    from classifier import load_classifier
+    from disambiguate import resolve
+    from operateImage import recognize_board
+
+    with Image.open(io.BytesIO(data)) as img:
+        result = recognize_board(img, load_classifier(_model_path))
+    resolved = resolve(result)
+    out = {
+        "board": "".join(str(num) for row in resolved.board for num in row),
+        "confidence": [round(float(c), 3) for c in result.confidence.ravel()],
+        "candidates": [
+            "".join(str(num) for num in cell) for cell in result.candidates.reshape(81, -1)
+        ],
+        "fail": result.fail,
+        "corrected": resolved.changed,
+    }
+    try:
+        out.update(solve_task(out["board"]))
+    except ValueError:
+        out["solution"] = None
+    return out
+
+
+class Service:
+    def __init__(
+            self,
+            workers: int = None,
+            max_inflight: int = None,
+            model_path: str = constants.MODEL_PATH,
+    ):
+        """
+        :param workers: processes doing the work, defaults to the number of CPUs
+        :param max_inflight: jobs accepted at once, defaults to 4 per worker
+        :param model_path: model loaded by every worker
+        """
+        workers = workers or os.cpu_count() or 1
+        self.max_inflight = max_inflight or workers * 4
+        self.inflight = 0
+        self.pool = ProcessPoolExecutor(
+            workers, initializer=_init_worker, initargs=(model_path,)
+        )
+        # Workers are forked on demand: start them all now, before there is a
+        # listening socket or client connection for them to inherit
+        for future in [self.pool.submit(os.getpid) for _ in range(workers)]:
+            future.result()
+        self.recorder = instrument.Recorder()
+
+    async def _run(self, fn, arg) -> Tuple[int, dict]:
+        if self.inflight >= self.max_inflight:
+            self.recorder.count("requests_rejected")
+            return 503, {"error": "busy, retry later"}
+        self.inflight += 1
+        try:
+            start = time.perf_counter()
+            result, events = await asyncio.get_running_loop().run_in_executor(
+                self.pool, _run_task, fn, arg
+            )
+            self.recorder.record(fn.__name__, time.perf_counter() - start)
+            for event in events:
+                if event["type"] == "stage":
+                    self.recorder.record(event["stage"], event["seconds"])
+                else:
+                    self.recorder.count(event["name"], event["n"])
+            return 200, result
+        except (ValueError, OSError) as e:
+            # Malformed puzzles and undecodable pictures
+            return 400, {"error": str(e)}
+        finally:
+            self.inflight -= 1
+
+    async def dispatch(self, method: str, path: str, body: bytes) -> Tuple[int, object]:
+        if path == "/health":
+            return 200, {"status": "ok", "inflight": self.inflight}
+        if path == "/metrics":
+            return 200, self.recorder.prometheus()
+        if path == "/solve":
+            if method != "POST":
+                return 405, {"error": "use POST"}
+            text = body.decode("utf-8", "replace").strip()
+            if text.startswith("{"):
+                try:
+                    text = str(json.loads(text)["puzzle"])
+                except (ValueError, KeyError, TypeError):
+                    return 400, {"error": 'expected {"puzzle": "..."}'}
+            return await self._run(solve_task, text)
+        if path == "/recognize":
+            if method != "POST":
+                return 405, {"error": "use POST"}
+            return await self._run(recognize_task, body)
+        return 404, {"error": "unknown path " + path}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            status, payload = await self._read_and_dispatch(reader)
+        except Exception as e:
+            status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+        if isinstance(payload, str):
+            data, content_type = payload.encode(), "text/plain; version=0.0.4"
+        else:
+            data, content_type = json.dumps(payload).encode(), "application/json"
+        headers = [
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {len(data)}",
+            "Connection: close",
+        ]
+        if status == 503:
+            headers.append("Retry-After: 1")
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode() + data)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def _read_and_dispatch(self, reader: asyncio.StreamReader) -> Tuple[int, object]:
+        request_line = (await reader.readline()).decode("latin-1").split()
+        if len(request_line) != 3:
+            return 400, {"error": "malformed request line"}
+        method, path, _ = request_line
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        body = b""
+        if method == "POST":
+            if "content-length" not in headers:
+                return 411, {"error": "Content-Length required"}
+            if not headers["content-length"].isdigit():
+                return 400, {"error": "bad Content-Length"}
+            length = int(headers["content-length"])
+            if length > MAX_BODY:
+                return 413, {"error": "body too large"}
+            body = await reader.readexactly(length)
+        return await self.dispatch(method, path.split("?")[0], body)
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8080) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self.handle, host, port)
+
+    def close(self):
+        self.pool.shutdown()
+
+
+async def _main(host: str, port: int, workers: Optional[int], max_inflight: Optional[int]):
+    service = Service(workers, max_inflight)
+    server = await service.serve(host, port)
+    print(f"Listening on http://{host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless sudoku solve and recognize service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("-j", "--workers", type=int, help="number of processes")
+    parser.add_argument("--max-inflight", type=int, help="jobs accepted at once")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(_main(args.host, args.port, args.workers, args.max_inflight))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Solve a stream of puzzles, one per line in the 81-char "."/"0" format:
+
+    python solveStream.py puzzles.txt -o solutions.txt -j 8
+    cat puzzles.txt | python solveStream.py - > solutions.txt
+
+Every input puzzle gives one output line in the same order: its solution, or
+an empty line if it is malformed or has no solution. Only a bounded number of
+chunks is in flight, so memory stays flat whatever the size of the input.
+"""
+import argparse
+import itertools
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, TextIO
+
+import solver
+
+
+def read_puzzles(stream: TextIO) -> Iterator[str]:
+    """
+    Puzzle field of every line, skipping blank lines and # comments.
+    Lines may carry more fields after the puzzle (separated by space or comma).
+    """
+    for line in stream:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        yield line.replace(",", " ").split()[0]
+
+
+def chunked(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def solve_chunk(puzzles: List[str]) -> List[str]:
+    out = []
+    for puzzle in puzzles:
+        try:
+            solution = solver.solve_flat(puzzle)
+        except ValueError:
+            solution = None
+        out.append(solver.format_puzzle(solution) if solution else "")
+    return out
+
+
+def solve_stream(
+        puzzles: Iterable[str],
+        workers: int = None,
+        chunk_size: int = 256,
+        max_pending: int = None,
+) -> Iterator[str]:
+    """
+    Solve puzzles in parallel chunks, yielding results in input order
+    :param puzzles: 81-char puzzles, can be a lazy iterator
+    :param workers: number of processes, defaults to the number of CPUs
+    :param chunk_size: puzzles sent to a worker at once
+    :param max_pending: chunks in flight, defaults to 2 per worker
+    """
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or workers * 2
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        for chunk in chunked(puzzles, chunk_size):
+            pending.append(pool.submit(solve_chunk, chunk))
+            if len(pending) >= max_pending:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Solve a file of puzzles, one per line")
+    parser.add_argument("input", nargs="?", default="-", help="puzzle file, - for stdin")
+    parser.add_argument("-o", "--output", help="solution file, stdout by default")
+    parser.add_argument("-j", "--workers", type=int, help="number of processes")
+    parser.add_argument("--chunk-size", type=int, default=256)
+    parser.add_argument("--progress", type=float, default=2.0, help="seconds between reports")
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.input == "-" else open(args.input)
+    out = open(args.output, "w") if args.output else sys.stdout
+    start = last_report = time.perf_counter()
+    count = failed = 0
+    try:
+        for solution in solve_stream(read_puzzles(source), args.workers, args.chunk_size):
+            out.write(solution + "\n")
+            count += 1
+            failed += not solution
+            now = time.perf_counter()
+            if now - last_report >= args.progress:
+                last_report = now
+                print(f"{count} puzzles, {count / (now - start):.0f}/s", file=sys.stderr)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.perf_counter() - start
+    print(
+        f"{count} puzzles ({failed} unsolved) in {elapsed:.2f}s "
+        f"({count / max(elapsed, 1e-9):.0f}/s)",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+from typing import Iterator, List, Optional, Sequence, Union
+
+import instrument
+
+# Candidates and placed digits are 9-bit masks, bit d - 1 standing for digit d
+ALL = 0x1FF
+ROW = [i // 9 for i in range(81)]
+COL = [i % 9 for i in range(81)]
+BOX = [(i // 27) * 3 + (i % 9) // 3 for i in range(81)]
+UNITS = (
+        [[r * 9 + c for c in range(9)] for r in range(9)]
+        + [[r * 9 + c for r in range(9)] for c in range(9)]
+        + [[i for i in range(81) if BOX[i] == b] for b in range(9)]
+)
+POPCOUNT = [bin(m).count("1") for m in range(ALL + 1)]
+DIGIT = {1 << d: d + 1 for d in range(9)}
+
+Board = List[List[int]]
+Puzzle = Union[str, Sequence[Sequence[int]], Sequence[int]]
+
+
+class SearchLimit(Exception):
+    """
+    Raised when a search runs out of its max_nodes budget
+    """
+
+
+def parse_puzzle(puzzle: Puzzle) -> List[int]:
+    """
+    Flatten a puzzle into 81 digits, 0 for empty cells
+    :param puzzle: 9 * 9 2d array, flat sequence of 81 ints or 81-char string
+                   where empty cells are "0" or "."
+    :return: list of 81 ints
+    """
+    if isinstance(puzzle, str):
+        puzzle = puzzle.strip()
+        if len(puzzle) != 81:
+            raise ValueError("Puzzle string must have 81 characters")
+        return [0 if ch in ".0" else int(ch) for ch in puzzle]
+    flat = [int(num) for row in puzzle for num in row] if len(puzzle) == 9 else [
+        int(num) for num in puzzle
+    ]
+    if len(flat) != 81 or not all(0 <= num <= 9 for num in flat):
+        raise ValueError("Puzzle must hold 81 digits between 0 and 9")
+    return flat
+
+
+def format_puzzle(flat: Sequence[int], empty: str = "0") -> str:
+    """
+    81-char string of a flat puzzle
+    """
+    return "".join(str(num) if num else empty for num in flat)
+
+
+def to_board(flat: Sequence[int]) -> Board:
+    return [list(flat[r * 9:(r + 1) * 9]) for r in range(9)]
+
+
+def _init_masks(flat: Sequence[int]):
+    """
+    :return: cell bits, row, column and box masks, None if two givens clash
+    """
+    cells = [0] * 81
+    rows, cols, boxes = [0] * 9, [0] * 9, [0] * 9
+    for i, num in enumerate(flat):
+        if not num:
+            continue
+        bit = 1 << (num - 1)
+        if (rows[ROW[i]] | cols[COL[i]] | boxes[BOX[i]]) & bit:
+            return None
+        cells[i] = bit
+        rows[ROW[i]] |= bit
+        cols[COL[i]] |= bit
+        boxes[BOX[i]] |= bit
+    return cells, rows, cols, boxes
+
+
+def _propagate(cells: list, rows: list, cols: list, boxes: list) -> bool:
+    """
+    Fill naked and hidden singles until nothing changes
+    :return: False if the board became contradictory
+    """
+    while True:
+        progress = False
+        # Naked singles: a cell with one candidate left
+        for i in range(81):
+            if cells[i]:
+                continue
+            r, c, b = ROW[i], COL[i], BOX[i]
+            cand = ALL & ~(rows[r] | cols[c] | boxes[b])
+            if not cand:
+                return False
+            if not cand & (cand - 1):
+                cells[i] = cand
+                rows[r] |= cand
+                cols[c] |= cand
+                boxes[b] |= cand
+                progress = True
+        if progress:
+            continue
+
+        # Hidden singles: a digit with one possible cell in a unit
+        for unit in UNITS:
+            once = twice = placed = 0
+            for i in unit:
+                if cells[i]:
+                    placed |= cells[i]
+                    continue
+                cand = ALL & ~(rows[ROW[i]] | cols[COL[i]] | boxes[BOX[i]])
+                twice |= once & cand
+                once |= cand
+            if once | placed != ALL:
+                return False
+            hidden = once & ~twice
+            if not hidden:
+                continue
+            for i in unit:
+                if cells[i]:
+                    continue
+                r, c, b = ROW[i], COL[i], BOX[i]
+                bit = hidden & ~(rows[r] | cols[c] | boxes[b])
+                if not bit:
+                    continue
+                if bit & (bit - 1):
+                    return False
+                cells[i] = bit
+                rows[r] |= bit
+                cols[c] |= bit
+                boxes[b] |= bit
+                progress = True
+        if not progress:
+            return True
+
+
+def _search(
+        cells: list, rows: list, cols: list, boxes: list, budget: list = None
+) -> Iterator[list]:
+    if budget is not None:
+        budget[0] -= 1
+        if budget[0] < 0:
+            raise SearchLimit()
+    if not _propagate(cells, rows, cols, boxes):
+        return
+
+    # Minimum remaining values: branch on the cell with the fewest candidates
+    best, best_count, best_cand = -1, 10, 0
+    for i in range(81):
+        if cells[i]:
+            continue
+        cand = ALL & ~(rows[ROW[i]] | cols[COL[i]] | boxes[BOX[i]])
+        count = POPCOUNT[cand]
+        if count < best_count:
+            best, best_count, best_cand = i, count, cand
+            if count == 2:
+                break
+    if best < 0:
+        yield cells
+        return
+
+    r, c, b = ROW[best], COL[best], BOX[best]
+    while best_cand:
+        bit = best_cand & -best_cand
+        best_cand ^= bit
+        new_cells, new_rows, new_cols, new_boxes = cells[:], rows[:], cols[:], boxes[:]
+        new_cells[best] = bit
+        new_rows[r] |= bit
+        new_cols[c] |= bit
+        new_boxes[b] |= bit
+        yield from _search(new_cells, new_rows, new_cols, new_boxes, budget)
+
+
+def iter_solutions(puzzle: Puzzle, max_nodes: int = None) -> Iterator[List[int]]:
+    """
+    Generate every solution of a puzzle as a flat list of 81 digits
+    :param max_nodes: raise SearchLimit after visiting this many search nodes
+    """
+    masks = _init_masks(parse_puzzle(puzzle))
+    if masks is None:
+        return
+    budget = None if max_nodes is None else [max_nodes]
+    for cells in _search(*masks, budget):
+        yield [DIGIT[bit] for bit in cells]
+
+
+def solve_flat(puzzle: Puzzle, max_nodes: int = None) -> Optional[List[int]]:
+    """
+    :param max_nodes: see iter_solutions
+    :return: first solution as a flat list of 81 digits, None if there is none
+    """
+    with instrument.stage("solve"):
+        return next(iter_solutions(puzzle, max_nodes), None)
+
+
+def solve(puzzle: Puzzle) -> Optional[Board]:
+    """
+    Solve a puzzle
+    :param puzzle: see parse_puzzle
+    :return: solved 9 * 9 2d array, None if the puzzle has no solution
+    """
+    solution = solve_flat(puzzle)
+    return to_board(solution) if solution else None
+
+
+def count_solutions(puzzle: Puzzle, limit: int = 2) -> int:
+    """
+    Count solutions, stopping once limit is reached
+    """
+    count = 0
+    for _ in iter_solutions(puzzle):
+        count += 1
+        if count >= limit:
+            break
+    return count
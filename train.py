@@ -1,20 +1,107 @@
+import argparse
+import hashlib
 import os
 import pickle
-import pprint
+from concurrent.futures import ProcessPoolExecutor
 
+import constants
+from model import save_model
 from operateImage import *
 
 
-def train():
-    train_set = {}
+def _file_hash(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def _image_feature(path: str):
+    """
+    Feature of one training picture, None if no digit can be found in it
+    """
+    feature = get_image_feature(Image.open(path))
+    return [float(x) for x in feature] if feature else None
+
+
+def load_feature_cache(path: str) -> dict:
+    """
+    :return: {picture path: (mtime, size, sha1, feature)}, empty if there is no cache
+             yet or it was made with other operateImage.feature_settings
+    """
+    if not os.path.isfile(path):
+        return {}
+    with open(path, "rb") as f:
+        data = pickle.load(f)
+    if data.get("params") != feature_settings():
+        print("feature settings changed, processing every picture")
+        return {}
+    return data["pictures"]
+
+
+def save_feature_cache(path: str, cache: dict) -> None:
+    temp = path + ".tmp"
+    with open(temp, "wb") as f:
+        pickle.dump({"params": feature_settings(), "pictures": cache}, f)
+    os.replace(temp, path)
+
+
+def train(
+        root: str = "train",
+        model_path: str = constants.MODEL_PATH,
+        cache_path: str = constants.TRAIN_CACHE_PATH,
+        workers: int = None,
+        rebuild: bool = False,
+):
+    """
+    Build the model from the pictures in root/1 .. root/9.
+    Features are cached by picture path, mtime and content hash, so only new or
+    changed pictures are processed again (every one after feature_settings change);
+    those are spread over a process pool.
+    :param root: directory holding one sub directory per digit
+    :param model_path: where the binary model is written (atomically)
+    :param cache_path: feature cache file
+    :param workers: number of processes, defaults to the number of CPUs
+    :param rebuild: ignore the cache and process every picture
+    :return: {digit: [feature, ...]}
+    """
+    cache = {} if rebuild else load_feature_cache(cache_path)
+    new_cache = {}
+    pictures = []
+    todo = []
     for i in range(1, 10):
-        features = []
-        for j in os.listdir(os.getcwd() + rf"\train\{i}"):
-            features.append(get_image_feature(Image.open(f"train/{i}/{j}")))
-        train_set[i] = list(features)
-    pprint.pprint(train_set)
-    with open("train.module", "wb") as f:
-        pickle.dump(train_set, f)
+        directory = os.path.join(root, str(i))
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            stat = os.stat(path)
+            pictures.append((i, path))
+            cached = cache.get(path)
+            if cached and cached[:2] == (stat.st_mtime, stat.st_size):
+                new_cache[path] = cached
+                continue
+            digest = _file_hash(path)
+            if cached and cached[2] == digest:
+                new_cache[path] = (stat.st_mtime, stat.st_size) + cached[2:]
+                continue
+            todo.append((path, (stat.st_mtime, stat.st_size, digest)))
+
+    print(f"{len(pictures)} pictures, {len(todo)} to process")
+    if todo:
+        with ProcessPoolExecutor(workers) as pool:
+            features = pool.map(_image_feature, [path for path, _ in todo], chunksize=8)
+            for (path, key), feature in zip(todo, features):
+                new_cache[path] = key + (feature,)
+
+    train_set = {i: [] for i in range(1, 10)}
+    for i, path in pictures:
+        feature = new_cache[path][3]
+        if feature is None:
+            print("no digit found in", path)
+            continue
+        train_set[i].append(feature)
+
+    features = [vec for num in train_set for vec in train_set[num]]
+    labels = [num for num in train_set for _ in train_set[num]]
+    save_model(model_path, np.array(features), np.array(labels))
+    save_feature_cache(cache_path, new_cache)
     return train_set
 
 
@@ -26,4 +113,10 @@ def main():
 
 
 if __name__ == "__main__":
-    train()
+    parser = argparse.ArgumentParser(description="Train the digit recognition model")
+    parser.add_argument("--root", default="train", help="directory of training pictures")
+    parser.add_argument("-o", "--output", default=constants.MODEL_PATH, help="model file")
+    parser.add_argument("-j", "--workers", type=int, help="number of processes")
+    parser.add_argument("--rebuild", action="store_true", help="ignore the feature cache")
+    args = parser.parse_args()
+    train(args.root, args.output, workers=args.workers, rebuild=args.rebuild)
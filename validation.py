@@ -0,0 +1,85 @@
+from typing import List, Set, Tuple
+
+Block = Tuple[int, int]
+
+
+def _units(block: Block) -> Tuple[int, int, int]:
+    """
+    Indices of the row, column and box counters of a block
+    """
+    i, j = block
+    return i, 9 + j, 18 + (i // 3) * 3 + j // 3
+
+
+class ConflictTracker:
+    """
+    Keep per-row, per-column and per-box digit counters of a board so that the
+    set of conflicting blocks is updated in constant time on every change
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Start over from an empty board
+        """
+        self.board = [[0 for x in range(9)] for y in range(9)]
+        # counts[unit][num]: how many times num appears in the row, column or box
+        self.counts = [[0] * 10 for _ in range(27)]
+        self.conflicts: Set[Block] = set()
+
+    def set(self, block: Block, number: int) -> Set[Block]:
+        """
+        Put a number on a block, replacing what was there
+        :return: blocks whose conflict state changed
+        """
+        assert 1 <= number <= 9
+        changed = self.clear(block)
+        self.board[block[0]][block[1]] = number
+        changed |= self._count(block, number, 1)
+        return changed
+
+    def clear(self, block: Block) -> Set[Block]:
+        """
+        Remove the number of a block
+        :return: blocks whose conflict state changed
+        """
+        number = self.board[block[0]][block[1]]
+        if not number:
+            return set()
+        self.board[block[0]][block[1]] = 0
+        return self._count(block, number, -1)
+
+    def is_conflict(self, block: Block) -> bool:
+        number = self.board[block[0]][block[1]]
+        return bool(number) and any(
+            self.counts[unit][number] > 1 for unit in _units(block)
+        )
+
+    def _count(self, block: Block, number: int, delta: int) -> Set[Block]:
+        touched = {block}
+        for unit in _units(block):
+            self.counts[unit][number] += delta
+            # Crossing between 1 and 2 changes the state of every holder of number in the unit
+            if self.counts[unit][number] - (delta > 0) == 1:
+                touched.update(
+                    b for b in self._unit_blocks(unit)
+                    if self.board[b[0]][b[1]] == number
+                )
+
+        changed = set()
+        for b in touched:
+            if self.is_conflict(b) != (b in self.conflicts):
+                self.conflicts.symmetric_difference_update({b})
+                changed.add(b)
+        return changed
+
+    @staticmethod
+    def _unit_blocks(unit: int) -> List[Block]:
+        if unit < 9:
+            return [(unit, j) for j in range(9)]
+        if unit < 18:
+            return [(i, unit - 9) for i in range(9)]
+        row, column = divmod(unit - 18, 3)
+        return [(row * 3 + i, column * 3 + j) for i in range(3) for j in range(3)]